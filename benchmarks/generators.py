@@ -0,0 +1,153 @@
+# Deterministic synthetic inputs for the benchmarks, shaped like the data
+# jqreport is used on. Every generator takes a number of items and a seed,
+# and returns the document as text, the way it would be piped in.
+import datetime
+import json
+import random
+
+SIZE_TIERS = {
+    'small': 100,
+    'medium': 10000,
+    'large': 100000,
+}
+
+STORAGE_CLASSES = ['STANDARD', 'STANDARD_IA', 'GLACIER', 'INTELLIGENT_TIERING']
+INSTANCE_TYPES = ['t3.micro', 't3.large', 'm5.xlarge', 'c5.2xlarge', 'r5.4xlarge']
+INSTANCE_STATES = [(16, 'running'), (80, 'stopped'), (48, 'terminated')]
+RESOURCE_TYPES = ['AWS::EC2::Instance', 'AWS::S3::Bucket', 'AWS::IAM::Role', 'AWS::Lambda::Function']
+EPOCH = datetime.datetime(2020, 1, 1)
+
+
+def _timestamp(rng):
+    return (EPOCH + datetime.timedelta(seconds=rng.randrange(86400 * 365))).isoformat() + '.000Z'
+
+
+def _hex(rng, length):
+    return ''.join(rng.choice('0123456789abcdef') for _ in range(length))
+
+
+def s3_list_objects(n, seed=0):
+    # aws s3api list-objects - one wide, regular dictlist
+    rng = random.Random(seed)
+    contents = [
+        {
+            "Key": "logs/{}/{}.json.gz".format(rng.randrange(1000), _hex(rng, 16)),
+            "LastModified": _timestamp(rng),
+            "ETag": '"{}"'.format(_hex(rng, 32)),
+            "Size": rng.randrange(1 << 30),
+            "StorageClass": rng.choice(STORAGE_CLASSES),
+            "Owner": {"DisplayName": "owner", "ID": _hex(rng, 64)},
+        }
+        for _ in range(n)
+    ]
+    return json.dumps({"Contents": contents}, indent=4)
+
+
+def ec2_describe_instances(n, seed=0):
+    # aws ec2 describe-instances - reservations of instances with tag lists
+    rng = random.Random(seed)
+    reservations = []
+    for _ in range(max(1, n // 4)):
+        instances = []
+        for _ in range(rng.randint(1, 7)):
+            code, name = rng.choice(INSTANCE_STATES)
+            instances.append({
+                "InstanceId": "i-{}".format(_hex(rng, 17)),
+                "InstanceType": rng.choice(INSTANCE_TYPES),
+                "LaunchTime": _timestamp(rng),
+                "State": {"Code": code, "Name": name},
+                "PrivateIpAddress": "10.{}.{}.{}".format(
+                    rng.randrange(256), rng.randrange(256), rng.randrange(256)),
+                "SecurityGroups": [
+                    {"GroupName": "sg-{}".format(i), "GroupId": "sg-{}".format(_hex(rng, 8))}
+                    for i in range(rng.randint(1, 3))
+                ],
+                "Tags": [
+                    {"Key": "Name", "Value": "host-{}".format(rng.randrange(10000))},
+                    {"Key": "Environment", "Value": rng.choice(['dev', 'test', 'prod'])},
+                ],
+            })
+        reservations.append({
+            "Groups": [],
+            "Instances": instances,
+            "OwnerId": str(rng.randrange(10 ** 12)),
+            "ReservationId": "r-{}".format(_hex(rng, 17)),
+        })
+    return json.dumps({"Reservations": reservations}, indent=4)
+
+
+def cloudformation_yaml(n, seed=0):
+    # CloudFormation template - deep dicts full of custom !Ref / !GetAtt tags
+    rng = random.Random(seed)
+    lines = [
+        "AWSTemplateFormatVersion: '2010-09-09'",
+        "Parameters:",
+        "  Environment:",
+        "    Type: String",
+        "    AllowedValues: [dev, test, prod]",
+        "Resources:",
+    ]
+    for i in range(n):
+        lines.extend([
+            "  Resource{}:".format(i),
+            "    Type: {}".format(rng.choice(RESOURCE_TYPES)),
+            "    Properties:",
+            "      Name: !Sub '${{Environment}}-resource-{}'".format(i),
+            "      Role: !GetAtt [Resource{}, Arn]".format(rng.randrange(n)),
+            "      DependsOn: !Ref Resource{}".format(rng.randrange(n)),
+            "      Tags:",
+            "        - Key: Environment",
+            "          Value: !Ref Environment",
+            "        - Key: Index",
+            "          Value: '{}'".format(i),
+            "      Config:",
+            "        Timeout: {}".format(rng.randrange(900)),
+            "        Nested:",
+            "          Enabled: {}".format(rng.choice(['true', 'false'])),
+            "          Targets: [!Ref Resource{}, !Ref Resource{}]".format(
+                rng.randrange(n), rng.randrange(n)),
+        ])
+    lines.append("Outputs:")
+    for i in range(min(n, 50)):
+        lines.extend([
+            "  Output{}:".format(i),
+            "    Value: !GetAtt [Resource{}, Arn]".format(i),
+        ])
+    return '\n'.join(lines) + '\n'
+
+
+def scalar_list(n, seed=0):
+    # A long list of scalars, e.g. the output of jq '.[] | .Name'
+    rng = random.Random(seed)
+    return json.dumps(["name-{}".format(rng.randrange(n * 10)) for _ in range(n)])
+
+
+def _mixed_value(rng, depth):
+    choice = rng.randrange(6 if depth else 4)
+    if choice == 0:
+        return rng.randrange(1000)
+    elif choice == 1:
+        return _hex(rng, rng.randint(1, 40))
+    elif choice == 2:
+        return None
+    elif choice == 3:
+        return rng.random() < 0.5
+    elif choice == 4:
+        return [_mixed_value(rng, depth - 1) for _ in range(rng.randint(0, 5))]
+    return {"k{}".format(rng.randrange(20)): _mixed_value(rng, depth - 1)
+            for _ in range(rng.randint(0, 5))}
+
+
+def mixed_list(n, seed=0):
+    # Pathological list of mixed types and shapes, nothing lines up
+    rng = random.Random(seed)
+    return json.dumps([_mixed_value(rng, 4) for _ in range(n)])
+
+
+CASES = {
+    's3_list_objects': s3_list_objects,
+    'ec2_describe_instances': ec2_describe_instances,
+    'cloudformation_yaml': cloudformation_yaml,
+    'scalar_list': scalar_list,
+    'mixed_list': mixed_list,
+}
@@ -0,0 +1,93 @@
+# Memory benchmark - the size of the interpreted Cognition tree, before any
+# html is rendered, for each synthetic case.
+#
+#   python benchmarks/memory.py --tiers small,medium --output memory.json
+#   python benchmarks/memory.py --tiers small,medium --baseline memory.json
+#
+# Memory is measured with tracemalloc, so only allocations made while the
+# tree is built are counted, not the parsed document. The fragment cache is
+# off, so that the tree isn't mixed up with cached html.
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from generators import CASES, SIZE_TIERS
+
+DEFAULT_TIERS = 'small,medium'
+DEFAULT_THRESHOLD = 0.1 # Allowed growth relative to the baseline before failing
+METRICS = ['tree_bytes', 'peak_bytes']
+
+
+def measure_case(case, tier):
+    from jqreport.cognition import Cognition, Context
+    from jqreport.loader import load_handle
+
+    items = SIZE_TIERS[tier]
+    data = load_handle(io.StringIO(CASES[case](items)))
+    tracemalloc.start()
+    cog = Cognition(data, context=Context(data, fragment_cache_size=0))
+    tree_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cog
+    return dict(case=case, tier=tier, items=items, tree_bytes=tree_bytes, peak_bytes=peak_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the memory used by the interpreted report tree.')
+    parser.add_argument('--cases', default=','.join(CASES),
+        help='Comma separated cases to run. Default: all ({})'.format(', '.join(CASES)))
+    parser.add_argument('--tiers', default=DEFAULT_TIERS,
+        help='Comma separated size tiers to run ({}). Default: {}'.format(
+            ', '.join(SIZE_TIERS), DEFAULT_TIERS))
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results to a previous results file.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='Fractional increase over the baseline counted as a regression. '
+             'Default: {}'.format(DEFAULT_THRESHOLD))
+    args = parser.parse_args()
+
+    results = []
+    for tier in args.tiers.split(','):
+        for case in args.cases.split(','):
+            result = measure_case(case, tier)
+            results.append(result)
+            sys.stderr.write('{case:<24} {tier:<7} tree {tree_bytes:>12,} B  '
+                             'peak {peak_bytes:>12,} B\n'.format(**result))
+
+    report = dict(
+        python=platform.python_version(), platform=platform.platform(),
+        results=results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        previous = {(r['case'], r['tier']): r for r in baseline['results']}
+        regressions = [
+            (result['case'], result['tier'], metric, old[metric], result[metric])
+            for result in results
+            for old in [previous.get((result['case'], result['tier']))] if old is not None
+            for metric in METRICS
+            if result[metric] > old[metric] * (1 + args.threshold)]
+        for case, tier, metric, old_value, new_value in regressions:
+            sys.stderr.write('REGRESSION {} {} {}: {} -> {}\n'.format(
+                case, tier, metric, old_value, new_value))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
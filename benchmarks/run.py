@@ -0,0 +1,156 @@
+# Benchmarks for the load, interpret and render stages.
+#
+#   python benchmarks/run.py --tiers small,medium --output results.json
+#   python benchmarks/run.py --baseline results.json --threshold 0.25
+#
+# Each case / tier runs in its own process, so that the peak RSS is for that
+# case alone. Results are written as JSON, and compared against a baseline
+# run if one is given. The exit code is 1 if anything regressed.
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS isn't reported there
+    resource = None
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from generators import CASES, SIZE_TIERS
+
+DEFAULT_TIERS = 'small,medium'
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.25 # Allowed slowdown relative to the baseline before failing
+METRICS = ['load_s', 'interpret_s', 'render_s', 'peak_rss_kb']
+MIN_COMPARABLE_SECONDS = 0.01 # Timings shorter than this are too noisy to compare
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() == 'Darwin':
+        # Bytes on macOS, kilobytes everywhere else
+        peak = peak // 1024
+    return peak
+
+
+def run_case(case, tier, repeat):
+    # Time one case in this process. The best of the repeats is reported.
+    from jqreport.cognition import Cognition
+    from jqreport.loader import load_handle
+
+    items = SIZE_TIERS[tier]
+    text = CASES[case](items)
+    result = dict(
+        case=case, tier=tier, items=items, input_bytes=len(text),
+        rss_before_kb=peak_rss_kb())
+    timings = {'load_s': [], 'interpret_s': [], 'render_s': []}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = load_handle(io.StringIO(text))
+        loaded = time.perf_counter()
+        cog = Cognition(data)
+        interpreted = time.perf_counter()
+        with open(os.devnull, 'w') as f:
+            cog.stream(f)
+        rendered = time.perf_counter()
+        timings['load_s'].append(loaded - start)
+        timings['interpret_s'].append(interpreted - loaded)
+        timings['render_s'].append(rendered - interpreted)
+        del data, cog
+    for metric, values in timings.items():
+        result[metric] = min(values)
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+
+def run_isolated(case, tier, repeat):
+    output = subprocess.check_output([
+        sys.executable, os.path.abspath(__file__),
+        '--single', case, tier, '--repeat', str(repeat)])
+    return json.loads(output)
+
+
+def compare(results, baseline, threshold):
+    # List of (case, tier, metric, baseline value, new value) that got worse
+    previous = {(r['case'], r['tier']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get((result['case'], result['tier']))
+        if old is None:
+            continue
+        for metric in METRICS:
+            old_value, new_value = old.get(metric), result.get(metric)
+            if old_value is None or new_value is None:
+                continue
+            if metric.endswith('_s') and max(old_value, new_value) < MIN_COMPARABLE_SECONDS:
+                continue
+            if new_value > old_value * (1 + threshold):
+                regressions.append((result['case'], result['tier'], metric, old_value, new_value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time jqreport on synthetic data.')
+    parser.add_argument('--cases', default=','.join(CASES),
+        help='Comma separated cases to run. Default: all ({})'.format(', '.join(CASES)))
+    parser.add_argument('--tiers', default=DEFAULT_TIERS,
+        help='Comma separated size tiers to run ({}). Default: {}'.format(
+            ', '.join(SIZE_TIERS), DEFAULT_TIERS))
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+        help='Number of runs of each case, the fastest is kept. Default: {}'.format(DEFAULT_REPEAT))
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results to a previous results file.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='Fractional increase over the baseline counted as a regression. '
+             'Default: {}'.format(DEFAULT_THRESHOLD))
+    parser.add_argument('--single', nargs=2, metavar=('CASE', 'TIER'),
+        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # Worker mode, one case in this process
+        json.dump(run_case(args.single[0], args.single[1], args.repeat), sys.stdout)
+        return
+
+    results = []
+    for tier in args.tiers.split(','):
+        for case in args.cases.split(','):
+            result = run_isolated(case, tier, args.repeat)
+            results.append(result)
+            sys.stderr.write('{case:<24} {tier:<7} load {load_s:8.3f}s  interpret {interpret_s:8.3f}s  '
+                             'render {render_s:8.3f}s  peak rss {peak_rss_kb} kB\n'.format(**result))
+
+    report = dict(
+        python=platform.python_version(), platform=platform.platform(),
+        results=results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for case, tier, metric, old_value, new_value in regressions:
+            sys.stderr.write('REGRESSION {} {} {}: {} -> {}\n'.format(
+                case, tier, metric, old_value, new_value))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Start-up benchmark - the time for a whole `jqr` run on a tiny input, which
+# is almost all interpreter start, imports and template loading.
+#
+#   python benchmarks/startup.py --runs 20 --output startup.json
+#   python benchmarks/startup.py --baseline startup.json --threshold 0.25
+#
+# The import of jqreport.main is timed on its own too. The first run is a
+# warm up (it fills the template bytecode cache) and isn't counted.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+DEFAULT_RUNS = 20
+DEFAULT_THRESHOLD = 0.25 # Allowed slowdown relative to the baseline before failing
+METRICS = ['import_s', 'report_s']
+TINY_INPUT = '{"name": "jqreport", "tags": ["a", "b"], "size": 1}'
+
+
+def time_command(command, runs):
+    # Median wall time of the command, after one uncounted warm up run
+    subprocess.check_call(command, cwd=REPO_DIR, stderr=subprocess.DEVNULL)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call(command, cwd=REPO_DIR, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time jqreport start-up on a tiny input.')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS,
+        help='Number of timed runs, the median is kept. Default: {}'.format(DEFAULT_RUNS))
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results to a previous results file.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='Fractional increase over the baseline counted as a regression. '
+             'Default: {}'.format(DEFAULT_THRESHOLD))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        in_file = os.path.join(directory, 'tiny.json')
+        with open(in_file, 'w') as f:
+            f.write(TINY_INPUT)
+        results = dict(
+            python=platform.python_version(), platform=platform.platform(),
+            python_s=time_command([sys.executable, '-c', 'pass'], args.runs),
+            import_s=time_command([sys.executable, '-c', 'import jqreport.main'], args.runs),
+            report_s=time_command([
+                sys.executable, '-m', 'jqreport.main', '-f', in_file,
+                '-o', os.path.join(directory, 'tiny.html')], args.runs),
+        )
+    sys.stderr.write('python {python_s:.3f}s  import {import_s:.3f}s  '
+                     'report {report_s:.3f}s\n'.format(**results))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [
+            (metric, baseline[metric], results[metric]) for metric in METRICS
+            if metric in baseline and results[metric] > baseline[metric] * (1 + args.threshold)]
+        for metric, old_value, new_value in regressions:
+            sys.stderr.write('REGRESSION {}: {} -> {}\n'.format(metric, old_value, new_value))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# Batch mode - many inputs to many reports in one run. Templates are loaded
+# once per process rather than once per file, inputs are shared out over a
+# process pool, and inputs that haven't changed since the last batch are
+# skipped.
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+from .cache import code_digest
+
+BATCH_OUTPUT_PATTERN = '{dir}/{stem}.html'
+BATCH_STATE_FILE = '.jqreport-batch.json'
+HASH_BLOCK_SIZE = 1024 * 1024
+# Options that change the report, a report made with other values is rebuilt
+BATCH_SETTINGS = ['input_format', 'ndjson', 'source_views', 'virtual_table_rows',
+                  'sampler', 'sample_size', 'sample_threshold', 'seed',
+                  'max_output_bytes', 'max_nodes', 'max_depth', 'compress']
+
+logger = logging.getLogger(__name__)
+
+
+def expand_inputs(patterns):
+    # Input files in the order given. Patterns are globbed here too, so
+    # quoted patterns work and the shell's argument limit doesn't matter.
+    inputs = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logger.warning("No inputs match {}".format(pattern))
+        for match in matches:
+            if match not in inputs and not os.path.isdir(match):
+                inputs.append(match)
+    return inputs
+
+
+def output_path(pattern, in_file):
+    # {dir}, {name} and {stem} are the input's directory, file name and
+    # file name without its extension
+    directory, name = os.path.split(in_file)
+    return pattern.format(dir=directory or '.', name=name, stem=os.path.splitext(name)[0])
+
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class BatchState:
+    # What each input looked like when its report was last built, kept in a
+    # JSON file between batches. The mtime and size are checked first, the
+    # input is only hashed if they've changed (e.g. the file was rewritten).
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = settings
+        self.inputs = dict()
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.inputs = json.load(f)
+            except ValueError:
+                logger.warning("Ignoring unreadable batch state {}".format(path))
+
+    def unchanged(self, in_file, out_file):
+        entry = self.inputs.get(in_file)
+        if entry is None or entry['output'] != out_file or entry['settings'] != self.settings \
+                or not os.path.exists(out_file):
+            return False
+        try:
+            stat = os.stat(in_file)
+        except OSError:
+            # Gone since the last batch, building it reports the error
+            return False
+        if entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return True
+        if entry['size'] == stat.st_size and entry['digest'] == file_digest(in_file):
+            # Same content, just touched
+            entry['mtime_ns'] = stat.st_mtime_ns
+            return True
+        return False
+
+    def record(self, in_file, out_file):
+        stat = os.stat(in_file)
+        self.inputs[in_file] = dict(
+            output=out_file, settings=self.settings, mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size, digest=file_digest(in_file))
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.inputs, f, indent=1, sort_keys=True)
+
+
+def build(args):
+    # Build one report, in this process or a pool worker. Errors are
+    # returned rather than raised, so one bad input doesn't stop the batch.
+    from .main import report
+    start = time.perf_counter()
+    try:
+        output_directory = args.shard_dir or os.path.dirname(args.out_file)
+        if output_directory:
+            os.makedirs(output_directory, exist_ok=True)
+        report(args)
+    except Exception as e:
+        return args.in_file, time.perf_counter() - start, '{}: {}'.format(
+            type(e).__name__, ' '.join(str(e).split()))
+    return args.in_file, time.perf_counter() - start, None
+
+
+def batch(args, output_paths):
+    # output_paths(out_file) gives the (index page, shard directory) of an output
+    start = time.perf_counter()
+    pattern = args.out_file or BATCH_OUTPUT_PATTERN
+    settings = {name: getattr(args, name) for name in BATCH_SETTINGS}
+    settings['code'] = code_digest()
+    state = BatchState(args.batch_state, settings)
+
+    tasks, outputs, skipped = [], dict(), []
+    for in_file in expand_inputs(args.batch):
+        out_file = output_path(pattern, in_file)
+        outputs[in_file] = out_file
+        if not args.force and state.unchanged(in_file, out_file):
+            skipped.append(in_file)
+            continue
+        task = argparse.Namespace(**vars(args))
+        task.in_file = in_file
+        task.out_file, task.shard_dir = output_paths(out_file)
+        # Files are spread over the workers, each file is rendered in one process
+        task.jobs = 1
+        task.profile = None
+        if args.cache_dir is not None:
+            # One cache per input - a run prunes whatever it didn't use
+            task.cache_dir = os.path.join(args.cache_dir, hashlib.blake2b(
+                os.path.abspath(in_file).encode('utf-8'), digest_size=8).hexdigest())
+        tasks.append(task)
+
+    if args.jobs > 1 and len(tasks) > 1:
+        import multiprocessing
+        with multiprocessing.Pool(min(args.jobs, len(tasks))) as pool:
+            results = list(pool.imap_unordered(build, tasks))
+    else:
+        results = [build(task) for task in tasks]
+
+    failed = 0
+    for in_file, seconds, error in sorted(results):
+        if error is None:
+            state.record(in_file, outputs[in_file])
+            sys.stderr.write('built   {:8.2f}s  {} -> {}\n'.format(seconds, in_file, outputs[in_file]))
+        else:
+            failed += 1
+            sys.stderr.write('FAILED  {:8.2f}s  {}: {}\n'.format(seconds, in_file, error))
+    for in_file in skipped:
+        sys.stderr.write('skipped            {} (unchanged)\n'.format(in_file))
+    state.save()
+    sys.stderr.write('{} inputs: {} built, {} skipped, {} failed in {:.2f}s\n'.format(
+        len(outputs), len(results) - failed, len(skipped), failed, time.perf_counter() - start))
+    return failed == 0
+
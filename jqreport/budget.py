@@ -0,0 +1,142 @@
+# Render budgets - upper bounds on the size of a report. Once the node or
+# depth budget is spent, the rest of the document is left out of the
+# interpreted tree, and shown as a collapsed JSON blob or an "N more items"
+# note. Once the output budget is spent, the remaining sections aren't
+# rendered at all.
+import json
+
+from .source import INDENT
+
+OMITTED_JSON_SIZE = 4096 # Left out subtrees with compact JSON up to this long are shown as JSON
+SOURCE_BUDGET_SHARE = 0.5 # Share of the remaining output budget a source panel can use
+BUDGET_SOURCE_SIZE = 64 * 1024 # Longest source panel under any budget
+
+
+class Budget:
+    # Limits for one report, and how much of each has been used. None is no limit.
+    def __init__(self, max_output_bytes=None, max_nodes=None, max_depth=None):
+        self.max_output_bytes = max_output_bytes
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        # Nodes interpreted so far, table rows count as nodes
+        self.nodes = 0
+        # Depth of the node being interpreted
+        self.depth = 0
+        # Bytes written so far, counted by BudgetWriter
+        self.output_bytes = 0
+        # Sections left out because the output budget was spent
+        self.omitted_sections = 0
+
+    def nodes_spent(self):
+        return self.max_nodes is not None and self.nodes >= self.max_nodes
+
+    def exhausted(self, data):
+        # Why data can't be interpreted, or None if it can. Depth only
+        # limits lists and dicts, scalars add no nesting.
+        if self.nodes_spent():
+            return 'node budget'
+        if self.max_depth is not None and self.depth > self.max_depth \
+                and isinstance(data, (dict, list)):
+            return 'depth budget'
+        return None
+
+    def rows_fitting(self, count):
+        # How many of count table rows there is room for, without spending them
+        if self.max_nodes is not None:
+            count = max(0, min(count, self.max_nodes - self.nodes))
+        return count
+
+    def rows(self, count):
+        # Spend the budget on up to count table rows, returns how many fit
+        count = self.rows_fitting(count)
+        self.nodes += count
+        return count
+
+    def output_spent(self):
+        return self.max_output_bytes is not None and self.output_bytes >= self.max_output_bytes
+
+
+class BudgetWriter:
+    # File wrapper counting the bytes written to it into the budget
+    def __init__(self, f, budget):
+        self.f = f
+        self.budget = budget
+
+    def write(self, s):
+        self.budget.output_bytes += len(s.encode('utf-8'))
+        return self.f.write(s)
+
+
+class BudgetRows:
+    # Rows of a table, as many as fit in the output budget. The budget is
+    # checked as the rows are rendered, so how many were left out (more) is
+    # only known once they have been iterated.
+    def __init__(self, rows, count, budget, more=0, index=None):
+        self.rows = rows
+        self.count = count
+        self.budget = budget
+        # Rows already left out, by the node budget
+        self.more = more
+        self.reason = 'node budget'
+        # Keys of the rows shown, filled in by rows if it is a dict table
+        self.index = index
+
+    def __iter__(self):
+        rows = iter(self.rows)
+        for idx in range(self.count):
+            # Checked before the next row is taken, so index stays in step
+            if self.budget.output_spent():
+                self.more += self.count - idx
+                self.reason = 'output budget'
+                return
+            yield next(rows)
+
+
+def count_chunks(chunks, budget):
+    # The chunks, counting their bytes into the budget as they pass. For html
+    # that is compressed before it is written, the budget bounds the html.
+    for chunk in chunks:
+        budget.output_bytes += len(chunk.encode('utf-8'))
+        yield chunk
+
+
+class BudgetSource:
+    # Source panel text under a budget. It is never longer than
+    # BUDGET_SOURCE_SIZE, nor than its share of the remaining output budget.
+    def __init__(self, data, budget):
+        self.data = data
+        self.budget = budget
+
+    def __str__(self):
+        limit = BUDGET_SOURCE_SIZE
+        if self.budget.max_output_bytes is not None:
+            limit = min(limit, int(SOURCE_BUDGET_SHARE * max(
+                0, self.budget.max_output_bytes - self.budget.output_bytes)))
+        text, complete = encode_within(self.data, limit, indent=INDENT)
+        if complete:
+            return text
+        return text + '\n... (cut short, budget)'
+
+
+def encode_within(data, limit, **options):
+    # JSON of data, as much of it as fits in limit characters, and whether
+    # that is all of it. Encoding stops at the limit, so huge subtrees are cheap.
+    encoder = json.JSONEncoder(default=str, **options)
+    chunks = []
+    size = 0
+    try:
+        for chunk in encoder.iterencode(data):
+            size += len(chunk)
+            if size > limit:
+                return ''.join(chunks), False
+            chunks.append(chunk)
+    except (TypeError, ValueError):
+        # e.g. dict keys that JSON can't have
+        return ''.join(chunks), False
+    return ''.join(chunks), True
+
+
+def compact_json(data, limit=OMITTED_JSON_SIZE):
+    # Compact JSON of data, or None if it is longer than limit
+    text, complete = encode_within(data, limit, separators=(',', ':'))
+    return text if complete else None
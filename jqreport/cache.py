@@ -0,0 +1,183 @@
+# Fragment cache - the same small subtrees turn up over and over in real
+# data (tag lists, policy documents, CloudFormation !Ref wrappers). Each
+# distinct subtree is interpreted and rendered once, and its html is reused.
+#
+# The html of a node contains its key path, so cached fragments are rendered
+# with a placeholder key, which is swapped for the real key when used.
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+
+from jinja2.filters import do_urlencode
+
+FRAGMENT_CACHE_SIZE = 64 * 1024 * 1024 # Characters of html kept in the cache
+FRAGMENT_CACHE_MAX_ITEMS = 100 # Only lists and dicts up to this long are cached
+FRAGMENT_MAX_SIZE = 1024 * 1024 # Fragments longer than this aren't kept
+
+CACHE_DB_FILE = 'fragments.sqlite'
+
+KEY_PLACEHOLDER = '\x00jqreport-key\x00'
+
+logger = logging.getLogger(__name__)
+
+
+def url_key(key):
+    # The key as the templates write it in element ids
+    return do_urlencode(key.replace('.', '_'))
+
+
+URL_KEY_PLACEHOLDER = url_key(KEY_PLACEHOLDER)
+
+
+class Fragment:
+    # Rendered html of a subtree, embedded by the templates like a Cognition
+    def __init__(self, html, key):
+        self.html = html
+        self.key = key
+
+    def __str__(self):
+        key = str(self.key)
+        return self.html.replace(KEY_PLACEHOLDER, key).replace(
+            URL_KEY_PLACEHOLDER, url_key(key))
+
+
+class FragmentCache:
+    # Size bounded LRU of rendered subtrees, keyed on the structural hash of
+    # the subtree and the flags it was interpreted with. Hashes are kept per
+    # container by identity, so each container is hashed once.
+    def __init__(self, data, max_size=FRAGMENT_CACHE_SIZE,
+                 max_items=FRAGMENT_CACHE_MAX_ITEMS):
+        self.data = data
+        self.max_size = max_size
+        self.max_items = max_items
+        self.size = 0
+        self.fragments = OrderedDict()
+        self.digests = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def wants(self, data):
+        return isinstance(data, (dict, list)) and 0 < len(data) <= self.max_items
+
+    def digest(self, obj):
+        if isinstance(obj, (dict, list)):
+            digest = self.digests.get(id(obj))
+            if digest is None:
+                h = hashlib.blake2b(digest_size=16)
+                if isinstance(obj, dict):
+                    h.update(b'{')
+                    for k, v in obj.items():
+                        h.update(self.digest(k))
+                        h.update(self.digest(v))
+                else:
+                    h.update(b'[')
+                    for v in obj:
+                        h.update(self.digest(v))
+                digest = self.digests[id(obj)] = h.digest()
+            return digest
+        # Type matters, 1, 1.0, True and "1" all render differently
+        return hashlib.blake2b(
+            '{}:{!r}'.format(type(obj).__name__, obj).encode('utf-8', 'backslashreplace'),
+            digest_size=16).digest()
+
+    def fragment(self, data, key, allow_table, render):
+        # render(key) interprets and renders the subtree under that key
+        cache_key = (self.digest(data), allow_table)
+        html = self.fragments.get(cache_key)
+        if html is not None:
+            self.hits += 1
+            self.fragments.move_to_end(cache_key)
+            return Fragment(html, key)
+        self.misses += 1
+        html = render(KEY_PLACEHOLDER)
+        if len(html) <= FRAGMENT_MAX_SIZE:
+            self.store(cache_key, html)
+        return Fragment(html, key)
+
+    def remember(self, cache_key, html):
+        # Keep html in memory, dropping the least recently used if it's full
+        self.fragments[cache_key] = html
+        self.size += len(html)
+        while self.size > self.max_size:
+            _, evicted = self.fragments.popitem(last=False)
+            self.size -= len(evicted)
+
+    def store(self, cache_key, html):
+        # Newly rendered html
+        self.remember(cache_key, html)
+
+    def close(self, complete=True):
+        pass
+
+
+def code_digest():
+    # Hash of jqreport's code and templates - cached html from any other
+    # version of them is never used
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.blake2b(digest_size=16)
+    for directory in (package_dir, os.path.join(package_dir, 'templates')):
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and name.endswith(('.py', '.j2')):
+                h.update(name.encode('utf-8'))
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+
+class PersistentFragmentCache(FragmentCache):
+    # Fragment cache that is also kept on disk between runs, so a report of
+    # an input that has hardly changed only renders the subtrees that have.
+    # Fragments that a run doesn't use are dropped when it closes, unless it
+    # didn't get to the end of the document.
+    def __init__(self, data, cache_dir, settings, **kwargs):
+        import sqlite3
+        super(PersistentFragmentCache, self).__init__(data, **kwargs)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, CACHE_DB_FILE))
+        # Give the space of pruned fragments back, only works on a new database
+        self.db.execute('PRAGMA auto_vacuum = FULL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS fragments '
+            '(key TEXT PRIMARY KEY, html TEXT NOT NULL, run INTEGER NOT NULL)')
+        # Fragments depend on the code and on the rendering options
+        self.namespace = hashlib.blake2b(
+            (code_digest() + repr(sorted(settings.items()))).encode('utf-8'),
+            digest_size=8).hexdigest()
+        self.run = int(self.db.execute(
+            'SELECT COALESCE(MAX(run), 0) + 1 FROM fragments').fetchone()[0])
+        self.disk_hits = 0
+
+    def db_key(self, cache_key):
+        digest, allow_table = cache_key
+        return '{}:{}:{:d}'.format(self.namespace, digest.hex(), allow_table)
+
+    def fragment(self, data, key, allow_table, render):
+        cache_key = (self.digest(data), allow_table)
+        if cache_key not in self.fragments:
+            row = self.db.execute(
+                'SELECT html FROM fragments WHERE key = ?', (self.db_key(cache_key),)).fetchone()
+            if row is not None:
+                # Rendered by an earlier run, keep it for the next one too
+                self.disk_hits += 1
+                self.db.execute(
+                    'UPDATE fragments SET run = ? WHERE key = ?', (self.run, self.db_key(cache_key)))
+                self.remember(cache_key, row[0])
+                self.hits += 1
+                return Fragment(row[0], key)
+        return super(PersistentFragmentCache, self).fragment(data, key, allow_table, render)
+
+    def store(self, cache_key, html):
+        super(PersistentFragmentCache, self).store(cache_key, html)
+        self.db.execute(
+            'INSERT OR REPLACE INTO fragments (key, html, run) VALUES (?, ?, ?)',
+            (self.db_key(cache_key), html, self.run))
+
+    def close(self, complete=True):
+        if complete:
+            self.db.execute('DELETE FROM fragments WHERE run < ?', (self.run,))
+        self.db.commit()
+        self.db.close()
+        logger.info("Fragment cache: {} hits ({} from disk), {} misses".format(
+            self.hits, self.disk_hits, self.misses))
@@ -1,100 +1,228 @@
 # This module is all about automating different views of data.
-import json
-import pkg_resources
-from jinja2 import Template
+import itertools
 import os
 import logging
-import statistics
-import random
 
-from jinja2 import Environment, PackageLoader, select_autoescape
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from jinja2.environment import TemplateStream
+
+from .budget import BudgetRows, BudgetSource, BudgetWriter, compact_json, count_chunks
+from .cache import FragmentCache, PersistentFragmentCache, Fragment, FRAGMENT_CACHE_SIZE
+from .compress import compress_chunks
+from .columns import table_stats, row_cells
+from .keypath import KeyPath, IndexPath, OnlyKeyPath
+from .lazy import LazySection
+from .ndjson import RecordFile
+from .shape import ShapeIndex, count_keys
+from .source import LazySource, SourceIndex
 
 TABLE_MIN_COLUMNS = 1
 DICTLIST_DICT_MIN_RATIO = 0.6 # Number of list entries that must be dict for structure to render as dictlist
 DICTLIST_DICT_KEY_MIN_RATIO = 0.1 # Minimum # of dicts which require key for it to be rendered in table
 DICTDICT_DICT_KEY_MIN_RATIO = 0.6 # Minimum # of dicts which require key for it to be rendered in table
-COMPLEXITY_SAMPLE_SIZE = 50   # Sample size for assessing complexity
-COMPLEX_LENGTH_THRESHOLD = 100 # Length threshold for an object to be considered complex
+STREAM_BUFFER_SIZE = 100 # Number of template chunks to join before each write when streaming
+WORKER_TASKS = 100 # Number of tasks to split the children into when rendering in a process pool
+VIRTUAL_TABLE_MIN_ROWS = 1000 # Tables with more rows than this are built in the browser from embedded JSON
 
-logger = logging.getLogger(__name__)
+TEMPLATE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
 
-env = Environment(
-    loader=PackageLoader('jqreport', 'templates'),
-    autoescape=select_autoescape(['html', 'xml'])
-)
+logger = logging.getLogger(__name__)
 
-template_top_level = env.get_template('page.html.j2')
-template_scalar = env.get_template('scalar.html.j2')
-template_dictlist = env.get_template('dictlist.html.j2')
-template_simple_kv = env.get_template('simple_kv.html.j2')
-template_complex_kv = env.get_template('complex_kv.html.j2')
-# template_list = env.get_template('scalar.html.j2')
-template_list = env.get_template('dictlist.html.j2')
+env = None
+
+
+def get_environment():
+    # The jinja environment, made on first use. Compiled templates are kept
+    # in a bytecode cache (in the temp directory), so after the first run
+    # templates are loaded rather than parsed and compiled again.
+    global env
+    if env is None:
+        env = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIRECTORY),
+            autoescape=select_autoescape(['html', 'xml']),
+            bytecode_cache=FileSystemBytecodeCache(),
+        )
+        env.globals['fragments'] = fragments
+    return env
+
+
+class LazyTemplate:
+    # A template that is only loaded the first time it is rendered, so a
+    # small report only pays for the templates it uses
+    def __init__(self, name):
+        self.name = name
+        self.template = None
+
+    def load(self):
+        if self.template is None:
+            self.template = get_environment().get_template(self.name)
+        return self.template
+
+    def render(self, *args, **kwargs):
+        return self.load().render(*args, **kwargs)
+
+    def generate(self, *args, **kwargs):
+        return self.load().generate(*args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return self.load().stream(*args, **kwargs)
+
+
+def fragments(node):
+    # Used by the templates to embed child nodes. Child Cognitions yield
+    # their html in chunks into the parent's stream instead of building
+    # the whole string first.
+    if isinstance(node, (Fragment, LazySection)):
+        return (str(node),)
+    if isinstance(node, (Scalar, Omitted)):
+        return node.generate()
+    if isinstance(node, Cognition):
+        shards = node.context.shards
+        if shards is not None and isinstance(node, (CognitionTable, CognitionList)) \
+                and len(node.data) > shards.min_items:
+            # Large section, write it to its own file and load it on demand
+            label = "{} ({} items)".format(node.key, len(node.data))
+            return (shards.embed(node.generate(), label),)
+        return node.generate()
+    return (node,)
+
+template_top_level = LazyTemplate('page.html.j2')
+template_body = LazyTemplate('body.html.j2')
+template_scalar = LazyTemplate('scalar.html.j2')
+template_dictlist = LazyTemplate('dictlist.html.j2')
+template_simple_kv = LazyTemplate('simple_kv.html.j2')
+template_complex_kv = LazyTemplate('complex_kv.html.j2')
+template_omitted = LazyTemplate('omitted.html.j2')
+# template_list = LazyTemplate('scalar.html.j2')
+template_list = template_dictlist
 
 
 def simplicity(obj):
-    # Rate the simplicity of the dictionary. Lower number is more simple.
+    # Rate the simplicity of the dictionary. Lower number is more simple.
     # 0 == scalar, 1 == list / flat, 2 == table, 3+ == complex
-    if not obj:
-        logger.debug("Object is null or empty, score 0")
-        return 0
-    if isinstance(obj, dict):
-        if len(obj) == 1:
-            logger.debug("Object is scalar dict, delegating to only child")
-            return simplicity(list(obj.values())[0])
-        logger.debug("Iterating over dict entries")
-        max_rval = 0
-        if len(obj.values()) > COMPLEX_LENGTH_THRESHOLD:
-            logger.debug("Object is large (n={}), sampling elements at random".format(len(obj.keys())))
-            sample = random.sample(obj.keys(), COMPLEXITY_SAMPLE_SIZE)
-        else:
-            sample = list(obj.keys())
-        for k in sample:
-            v = obj[k]
-            logger.debug("key: {}, value: {}".format(k, v))
-            child_simplicity = simplicity(v)
-            max_rval = max(max_rval, child_simplicity)
-            if max_rval >= 2:
-                # no point going further, child is a horrible mess of tangled 
-                # json and jumbled lists, break now while we're ahead
-                logger.debug("Key {} has score {}, object score {}".format(
-                    k, child_simplicity, child_simplicity + 1))
-                return max_rval + 1
-        logger.debug("Dictionary non-trivial, but contents are simple, score 1.")
-        return max_rval + 1
-
-    elif isinstance(obj, list):
-        if len(obj) == 0:
-            logger.debug("List is empty, score 0")
-            return 0 # Empty or scalar, simple
-        elif len(obj) == 1:
-            logger.debug("Object is scalar list, delegating to only child")
-            return simplicity(obj[0])
-        else:
-            if len(obj) > COMPLEX_LENGTH_THRESHOLD:
-                logger.debug("Object is large (n={}), sampling elements at random".format(len(obj)))
-                sample = random.sample(obj, COMPLEXITY_SAMPLE_SIZE)
+    return ShapeIndex(obj).simplicity(obj)
+
+
+class Context:
+    # State shared by every node of a Cognition tree
+    def __init__(self, data, source_views=False, virtual_table_rows=VIRTUAL_TABLE_MIN_ROWS,
+                 shards=None, pool=None, profile=None, sampler=None,
+                 fragment_cache_size=FRAGMENT_CACHE_SIZE, cache_dir=None, lazy=None,
+                 budget=None, compress=False):
+        # Shape analysis of each container, done once per container
+        self.shapes = ShapeIndex(data, sampler=sampler)
+        # Whole document source, if source views are enabled
+        self.source = SourceIndex(data) if source_views else None
+        # Row count above which tables are virtualized (None to never virtualize)
+        self.virtual_table_rows = virtual_table_rows
+        # ShardWriter for large sections, if the report is sharded
+        self.shards = shards
+        # Process pool for interpreting and rendering sibling subtrees
+        self.pool = pool
+        # Profile to record node and template counts in, if profiling
+        self.profile = profile
+        # LazySections of a served report, nested sections are rendered on request
+        self.lazy = lazy
+        # Budget limiting the size of the report, if any
+        self.budget = budget
+        # Whether the body of the page is gzipped, and unpacked by the browser
+        self.compress = compress
+        # Rendered html of repeated subtrees. Shards are written while a
+        # fragment is rendered, so they would keep the placeholder keys.
+        self.fragment_cache_size = fragment_cache_size
+        self.fragment_cache = None
+        if budget is not None:
+            # How a subtree is shown depends on where it is and on what is
+            # left of the budget, and cache hits would skip counting nodes
+            fragment_cache_size = 0
+        if fragment_cache_size and shards is None:
+            if cache_dir is not None:
+                # Kept between runs, so unchanged subtrees are never re-rendered
+                self.fragment_cache = PersistentFragmentCache(
+                    data, cache_dir, self.worker_options(), max_size=fragment_cache_size)
             else:
-                logger.debug("Iterating over list entries")
-                sample = obj
-            max_rval = 0
-            for idx, v in enumerate(sample):
-                child_simplicity = simplicity(v)
-                max_rval = max(max_rval, child_simplicity)
-                if max_rval >= 3:
-                    # no point going further, child is a horrible mess of tangled 
-                    # json and jumbled lists, break now while we're ahead
-                    logger.debug("Index {} has score {}, object score {}".format(
-                        idx, child_simplicity, child_simplicity + 1))
-                    return max_rval + 1
-
-            logger.debug("List non-trivial, but contents are simple, score 1.")
-            return max_rval + 1
-
-    else:
-        # This object is scalar
-        logger.debug("Object is scalar, score 0.")
-        return 0
+                self.fragment_cache = FragmentCache(data, max_size=fragment_cache_size)
+
+    @property
+    def deferred(self):
+        # Whatever loads parts of the page on demand (shards or a server), if any
+        return self.shards if self.shards is not None else self.lazy
+
+    def fragments(self, node):
+        # fragments(), for templates once the output budget has been spent.
+        # The first section left out says so, the rest are dropped. Plain
+        # values of flat dicts and lists aren't sections, they pass through.
+        budget = self.budget
+        if not isinstance(node, (Cognition, Scalar, Fragment, LazySection)) \
+                or not budget.output_spent():
+            return fragments(node)
+        budget.omitted_sections += 1
+        if budget.omitted_sections > 1:
+            return ()
+        return Omitted(None, node.key, 'output budget', more=0).generate()
+
+    def close(self, complete=True):
+        # Save anything that outlives the report. complete is False if the
+        # report failed part way through.
+        if self.fragment_cache is not None:
+            self.fragment_cache.close(complete)
+
+    def worker_options(self):
+        # Arguments for the Context of a subtree rendered in another process
+        return dict(
+            source_views=self.source is not None,
+            virtual_table_rows=self.virtual_table_rows,
+            sampler=self.shapes.sampler,
+            fragment_cache_size=self.fragment_cache_size)
+
+
+def render_subtree(task):
+    # Process pool worker - interpret and render one subtree on its own.
+    # Returns the same html the subtree would have added to the parent's stream.
+    data, key, options = task
+    context = Context(data, **options)
+    return ''.join(fragments(interpret_data(data=data, key=key, context=context)))
+
+
+def render_subtrees(tasks):
+    # Process pool worker - render_subtree for each of a chunk of siblings
+    return [render_subtree(task) for task in tasks]
+
+
+def interpret_children(items, context):
+    # Interpret the (key, data) children of a node. With a process pool, each
+    # child is interpreted and rendered in a worker and comes back as html.
+    budget = context.budget
+    if budget is not None:
+        # Stops when the node budget runs out, the caller notes the rest.
+        # Not shared with worker processes, so always interpreted here.
+        children = []
+        for k, v in items:
+            if budget.nodes_spent():
+                break
+            children.append(interpret_data(data=v, key=k, context=context))
+        return children
+    if context.pool is None:
+        return [interpret_data(data=v, key=k, context=context) for k, v in items]
+    items = list(items)
+    options = context.worker_options()
+    chunksize = max(1, len(items) // WORKER_TASKS)
+    chunks = [items[start:start + chunksize] for start in range(0, len(items), chunksize)]
+    # A task per chunk, so a chunk that fails doesn't stop the others
+    results = [
+        context.pool.apply_async(render_subtrees, ([(v, str(k), options) for k, v in chunk],))
+        for chunk in chunks]
+    children = []
+    for chunk, result in zip(chunks, results):
+        try:
+            children.extend(result.get())
+        except Exception as e:
+            # Usually data that can't be pickled
+            logger.info("Couldn't render {} in a worker ({}: {}), rendering here.".format(
+                chunk[0][0] if len(chunk) == 1 else '{} - {}'.format(chunk[0][0], chunk[-1][0]),
+                type(e).__name__, e))
+            children.extend(interpret_data(data=v, key=k, context=context) for k, v in chunk)
+    return children
 
 # 1: Render lists, # 2: stop embedded tables..
 # TODO fix bug - pass thru key being hidden in single value dicts. eg cfn.yaml conditions
@@ -110,7 +238,48 @@ def simplicity(obj):
 # TODO: Render dictionary of dictionaries as a dictlist if children share keys, eg cfn parameters
 
 # simplicity(data)
-def interpret_data(data, key='.', allow_table=True):
+def interpret_data(data, key='.', allow_table=True, context=None):
+    if context is None:
+        context = Context(data)
+    budget = context.budget
+    if budget is not None:
+        reason = budget.exhausted(data) if key != '.' else None
+        budget.nodes += 1
+        if reason is not None:
+            # Shown as JSON, or just counted if it's big
+            return Omitted(data, key, reason)
+    lazy = context.lazy
+    if lazy is not None and lazy.wants(data, key):
+        # Served report, the browser asks for this section when it's opened
+        return lazy.defer(data, key, allow_table)
+    cache = context.fragment_cache
+    if cache is not None and key != '.' and cache.wants(data):
+        # Repeated subtrees are only interpreted and rendered once
+        return cache.fragment(data, key, allow_table, lambda placeholder: render_fragment(
+            data, key, placeholder, allow_table, context))
+    return interpret_node(data, key, allow_table, context)
+
+
+def render_fragment(data, key, placeholder, allow_table, context):
+    # Interpret and render a subtree for the fragment cache, under the placeholder key
+    if context.profile is None:
+        return ''.join(fragments(interpret_node(data, placeholder, allow_table, context)))
+    with context.profile.fragment(key):
+        return ''.join(fragments(interpret_node(data, placeholder, allow_table, context)))
+
+
+def analyse(method, data, key, context):
+    # Shape analysis of data, counted against key when profiling
+    if context.profile is None:
+        return method(data)
+    with context.profile.timed(key, 'shape_s'):
+        return method(data)
+
+
+def interpret_node(data, key, allow_table, context):
+    if isinstance(data, RecordFile):
+        # Streamed NDJSON records, always a table
+        return CognitionRecords(data=data, key=key, context=context)
     if not data:
         # Data is null, empty or "None".
         return str(data)
@@ -119,71 +288,166 @@ def interpret_data(data, key='.', allow_table=True):
         if len(data) == 1:
             # Perhaps I should create a new class for this..
             logger.debug("Object is simple, return recursion.")
-            return interpret_data(data[0], key="{}[0]".format(key))
+            return interpret_data(data[0], key=IndexPath(key, 0), context=context)
 
         # I am a list... let's look at elements
         else:
             if not allow_table:
                 logger.debug("Tables not allowed in context, exit early.")
-                return CognitionList(data=data, key=key)
+                return CognitionList(data=data, key=key, context=context)
 
-            if len(data) > COMPLEX_LENGTH_THRESHOLD:
-                logger.debug("Object is long (n={}), sampling elements at random".format(len(data)))
-                sample = random.sample(data, COMPLEXITY_SAMPLE_SIZE)
-            else:
-                sample = data
-            try:
-                modal_type = statistics.mode([el.__class__ for el in sample])
-            except statistics.StatisticsError:
+            shape = analyse(context.shapes.shape, data, key, context)
+            modal_type = shape.modal_type
+            if modal_type is None:
                 # This can happen when types are mixed
                 # I guess this is what's causing the issue...
                 logger.info("Couldn't find modal type of object {}.".format(key))
                 # Try to render as table
                 modal_type = dict
-            data_simplicity = simplicity(sample)
+            data_simplicity = shape.simplicity
             logger.info("Object simplicity rating is {}".format(data_simplicity))
             if modal_type and modal_type == dict and data_simplicity <= 3:
                 # return CognitionTable(data=data, key=key)
                 try:
-                    return CognitionTable(data=data, key=key)
+                    return CognitionTable(data=data, key=key, context=context)
                 except Exception as e:
                     # Doesn't work for some reason...
                     logger.info("Couldn't format object {} as dictlist.".format(key))
-                    return CognitionList(data=data, key=key)
+                    return CognitionList(data=data, key=key, context=context)
 
             else:
                 # List contains complex or generic types, return other
-                return CognitionList(data=data, key=key)
+                return CognitionList(data=data, key=key, context=context)
     elif isinstance(data, dict):
         # data is dictionary, check if simple or complex
         if len(data) == 1:
             sub_key = list(data.keys())[0]
-            return interpret_data(data[sub_key], key="{}.{}".format(key.rstrip('.'), sub_key))
+            return interpret_data(data[sub_key], key=OnlyKeyPath(key, sub_key), context=context)
         else:
-            data_simplicity = simplicity(data)
+            data_simplicity = analyse(context.shapes.simplicity, data, key, context)
             logger.info("Object simplicity rating is {}".format(data_simplicity))
             if data_simplicity <= 2:
-                return CognitionDictFlat(data=data, key=key)
+                return CognitionDictFlat(data=data, key=key, context=context)
             # elif data_simplicity == 2:
             #     return CognitionDict(data=data, key=key, template=template_simple_kv)
             else:
                 try:
                     # Try to render as a table
-                    return CognitionTable(data=data, key=key)
+                    return CognitionTable(data=data, key=key, context=context)
                 except Exception as e:
                     # Doesn't work for some reason...
                     logger.info("Couldn't format object {} as table.".format(key))
-                    return CognitionDict(data=data, key=key, template=template_complex_kv)
+                    return CognitionDict(data=data, key=key, template=template_complex_kv, context=context)
     else:
         logger.debug("Data is a scalar, return a simple template")
-        return Cognition(data=data, key=key, template=template_scalar)
+        return Scalar(data, key, context)
+
+
+class Scalar:
+    # Leaf of the tree. There are a lot of these, so they are kept small and
+    # don't go through interpret() like the Cognition nodes.
+    __slots__ = ('data', 'key', 'context')
+
+    def __init__(self, data, key, context):
+        self.data = data
+        self.key = key
+        self.context = context
+
+    def generate(self):
+        if self.context.profile is not None:
+            self.context.profile.template_rendered(template_scalar)
+        return template_scalar.generate(contents=str(self.data), key=str(self.key))
+
+
+def count_items(count):
+    return "{} item{}".format(count, '' if count == 1 else 's')
+
+
+class Omitted:
+    # Part of the document left out by the render budget. Shown as collapsed
+    # compact JSON if that's short, otherwise only counted. With more, it
+    # stands for that many siblings which were left out.
+    __slots__ = ('data', 'key', 'reason', 'more')
+
+    def __init__(self, data, key, reason, more=None):
+        self.data = data
+        self.key = key
+        self.reason = reason
+        self.more = more
+
+    def generate(self):
+        blob = None
+        if self.more == 0:
+            summary = "The rest of the report is not shown ({})".format(self.reason)
+        elif self.more is not None:
+            summary = "{} more {} not shown ({})".format(
+                self.more, 'item' if self.more == 1 else 'items', self.reason)
+        else:
+            blob = compact_json(self.data)
+            items = count_items(len(self.data) if isinstance(self.data, (dict, list)) else 1)
+            if blob is None:
+                summary = "{} not shown ({})".format(items, self.reason)
+            else:
+                summary = "{}, as JSON ({})".format(items, self.reason)
+        return template_omitted.generate(key=str(self.key), summary=summary, blob=blob)
+
+
+class BudgetChildren:
+    # Children of a list or dict node, for templates when there is an output
+    # budget. Once it is spent, the rest of the children are one "N more
+    # items" note, rather than a row or entry each.
+    __slots__ = ('children', 'key', 'budget')
+
+    def __init__(self, children, key, budget):
+        self.children = children
+        self.key = key
+        self.budget = budget
+
+    def __len__(self):
+        return len(self.children)
+
+    def __iter__(self):
+        for idx, child in enumerate(self.children):
+            if self.budget.output_spent():
+                yield Omitted(None, self.key, 'output budget', more=len(self.children) - idx)
+                return
+            yield child
+
+    def items(self):
+        for idx, item in enumerate(self.children.items()):
+            if self.budget.output_spent():
+                yield '...', Omitted(None, self.key, 'output budget', more=len(self.children) - idx)
+                return
+            yield item
+
 
 class Cognition:
-    def __init__(self, data, key='.', template=template_top_level):
+    # Nodes are kept small, a big document has millions of them
+    __slots__ = ('data', 'key', 'template', 'context', 'contents')
+
+    def __init__(self, data, key='.', template=template_top_level, context=None):
         self.data = data
         self.key = key
         self.template = template
-        self.interpret()
+        # Context shared by the whole tree
+        self.context = context if context is not None else Context(data)
+        # Children of this node are a level deeper. The page isn't a level,
+        # so the children of the document's top container are at depth 1.
+        budget = self.context.budget
+        if template is template_top_level:
+            budget = None
+        if budget is not None:
+            budget.depth += 1
+        try:
+            if self.context.profile is None:
+                self.interpret()
+            else:
+                with self.context.profile.timed(self.key, 'interpret_s'):
+                    self.interpret()
+                self.context.profile.node_created(self)
+        finally:
+            if budget is not None:
+                budget.depth -= 1
 
     def __str__(self):
         # Really basic hello world style thing to start with
@@ -194,21 +458,63 @@ class Cognition:
     def interpret(self):
         # Let's try to make some guesses about the data.
         # Try to work out how to display myself....
-        if isinstance(self.data, list) or isinstance(self.data, dict):
+        if isinstance(self.data, (list, dict, RecordFile)):
             # Complex type, interpret data
-            self.contents = interpret_data(data=self.data, key=self.key)
+            self.contents = interpret_data(data=self.data, key=self.key, context=self.context)
         else:
             self.contents = str(self.data)
 
+    def template_vars(self):
+        # raw is only serialized if the template prints it
+        variables = dict(
+            contents=self.contents, raw=LazySource(self.data, self.context.source),
+            key=str(self.key), source_views=self.context.source is not None,
+            deferred=self.context.deferred)
+        budget = self.context.budget
+        if budget is not None:
+            # The source panel can't be the whole document
+            variables['raw'] = BudgetSource(self.data, budget)
+            if budget.max_output_bytes is not None:
+                variables['fragments'] = self.context.fragments
+        if self.context.compress and self.template is template_top_level:
+            # Compressed as it is rendered, like a shard
+            body = template_body.generate(**variables)
+            if budget is not None and budget.max_output_bytes is not None:
+                body = count_chunks(body, budget)
+            variables['payload'] = compress_chunks(body)
+        return variables
+
     def render(self):
         # Create the document.
-        return self.template.render(
-            contents=self.contents, raw=json.dumps(self.data, indent=2), key=self.key)
+        if self.context.profile is not None:
+            self.context.profile.template_rendered(self.template)
+        return self.template.render(**self.template_vars())
+
+    def generate(self):
+        # Create the document, one chunk at a time
+        if self.context.profile is None:
+            return self.template.generate(**self.template_vars())
+        self.context.profile.template_rendered(self.template)
+        return self.context.profile.timed_chunks(
+            self.key, self.template.generate(**self.template_vars()))
+
+    def stream(self, f, buffer_size=STREAM_BUFFER_SIZE):
+        # Write the document to the file handle as it is rendered
+        budget = self.context.budget
+        if budget is not None and budget.max_output_bytes is not None and not self.context.compress:
+            # Compressed pages count the html of the body instead
+            f = BudgetWriter(f, budget)
+        template_stream = TemplateStream(self.generate())
+        if buffer_size:
+            template_stream.enable_buffering(buffer_size)
+        template_stream.dump(f)
 
 class CognitionList(Cognition):
     # TODO
-    def __init__(self, data, key, template=template_list):
-        super(CognitionList, self).__init__(data, key, template)
+    __slots__ = ()
+
+    def __init__(self, data, key, template=template_list, context=None):
+        super(CognitionList, self).__init__(data, key, template, context)
     # contents will probably need to be overloaded for this one...
     # This is where the smart stuff about analysing strings numbers etc for similarity goes...
 
@@ -228,14 +534,18 @@ class CognitionList(Cognition):
             #     return None
     def interpret(self):
         # This is just a first attempt.. may want to add exceptions for other types
+        children = interpret_children(
+            ((IndexPath(self.key, idx), v) for idx, v in enumerate(self.data)),
+            self.context
+        )
+        if len(children) < len(self.data):
+            # Out of budget
+            children.append(Omitted(None, self.key, 'node budget', more=len(self.data) - len(children)))
+        budget = self.context.budget
+        if budget is not None and budget.max_output_bytes is not None:
+            children = BudgetChildren(children, self.key, budget)
         self.contents = {
-            "data": [
-                interpret_data(
-                    data=v,
-                    key="{}[{}]".format(self.key, idx)
-                )
-                for idx, v in enumerate(self.data)
-            ],
+            "data": children,
             "table_keys": ["entry"],
             "key_counts": len(self.data),
         }
@@ -248,8 +558,10 @@ class CognitionTable(Cognition):
     # TODO - display missing keys, allow sort on table, filter by keys
     # show some charts for basic stuff if the data is suitable
     # .e.g. date histogram for date fields, pie chart for low cardinality fields
-    def __init__(self, data, key, template=template_dictlist):
-        super(CognitionTable, self).__init__(data, key, template)
+    __slots__ = ('dict_count', 'key_counts', 'dict_ratio', 'table_keys')
+
+    def __init__(self, data, key, template=template_dictlist, context=None):
+        super(CognitionTable, self).__init__(data, key, template, context)
         logger.debug("Table created")
 
     def interpret(self):
@@ -261,27 +573,31 @@ class CognitionTable(Cognition):
         else:
             # First pass analysis - how many objects are dicts,
             # how many keys are shared?
-            self.dict_count = 0
-            self.key_counts = dict()
+            rows = self.data.values() if isinstance(self.data, dict) else self.data
+            budget = self.context.budget
+            if budget is None:
+                shape = analyse(self.context.shapes.shape, self.data, self.key, self.context)
+                self.dict_count = shape.dict_count
+                self.key_counts = shape.key_counts
+                counted = len(self.data)
+            else:
+                # Only the rows there is room for are looked at
+                counted = budget.rows_fitting(len(self.data))
+                if not counted:
+                    raise Exception("No table rows left in the budget.")
+                rows = list(itertools.islice(rows, counted))
+                self.dict_count, self.key_counts = count_keys(rows)
             if isinstance(self.data, dict):
-                child_iter = self.data.values()
                 min_ratio = DICTDICT_DICT_KEY_MIN_RATIO
             else:
-                child_iter = self.data
                 min_ratio = DICTLIST_DICT_KEY_MIN_RATIO
-            for d in child_iter:
-                if isinstance(d, dict):
-                    self.dict_count = self.dict_count + 1
-                    for k, v in d.items():
-                        self.key_counts[k] = self.key_counts.get(k, 0) + 1
-                        # TODO - analyse types in v?
 
             # Ideal: 1, can still work well with around 0.5
-            self.dict_ratio = self.dict_count / len(self.data)
+            self.dict_ratio = self.dict_count / counted
             self.table_keys = []
             if self.dict_ratio >= DICTLIST_DICT_MIN_RATIO:
                 for k, count in self.key_counts.items():
-                    if count / len(self.data) >= min_ratio:
+                    if count / counted >= min_ratio:
                         # Only include dict keys if they appear in enough entries
                         self.table_keys.append(k)
                 if len(self.table_keys) < TABLE_MIN_COLUMNS:
@@ -291,8 +607,41 @@ class CognitionTable(Cognition):
                     "dict_ratio": self.dict_ratio,
                     "table_keys": self.table_keys,
                     "key_counts": self.key_counts,
-                    "ratio": DICTLIST_DICT_MIN_RATIO
+                    "ratio": DICTLIST_DICT_MIN_RATIO,
+                    # Keys left out of the table, with the number of rows that have them
+                    "omitted_keys": {
+                        k: count for k, count in self.key_counts.items()
+                        if k not in self.table_keys
+                    },
+                    "column_stats": table_stats(rows, self.table_keys),
+                    # Rows the key counts and statistics are taken from
+                    "counted_rows": counted,
                 }
+                shown = len(self.data)
+                if budget is not None:
+                    # Each row costs a node, rows past the budget are left out
+                    shown = budget.rows(len(self.data))
+                    items = itertools.islice(
+                        self.data.items() if isinstance(self.data, dict) else self.data, shown)
+                virtual_table_rows = self.context.virtual_table_rows
+                if virtual_table_rows is not None and shown > virtual_table_rows:
+                    logger.debug("Table {} has {} rows, virtualizing".format(self.key, len(self.data)))
+                    if self.context.lazy is not None:
+                        # Served report, the server sends one page at a time
+                        self.contents["rows_url"] = self.context.lazy.rows_url(self)
+                    elif budget is not None:
+                        # Rows are written one at a time, while they fit
+                        index = [] if isinstance(self.data, dict) else None
+                        self.contents["rows"] = self.contents["budget_rows"] = BudgetRows(
+                            self.budget_cells(items, index), shown, budget,
+                            more=len(self.data) - shown, index=index)
+                    else:
+                        # Too many rows for the DOM, the browser builds the
+                        # visible page from a columnar copy of the data
+                        self.contents["columns"] = self.columns()
+                elif budget is not None:
+                    self.contents["shown"] = self.contents["budget_rows"] = BudgetRows(
+                        items, shown, budget, more=len(self.data) - shown)
 
             else:
                 # Too few objects to display as a table, let's 
@@ -300,10 +649,86 @@ class CognitionTable(Cognition):
                 raise Exception("Too few dictionaries in list to display as table.")
 
 
+    def columns(self):
+        # Column oriented copy of the table for the embedded JSON. Cells hold
+        # the same text as the inline table, missing keys are null.
+        if isinstance(self.data, dict):
+            index = [str(k) for k in self.data.keys()]
+            rows = self.data.values()
+        else:
+            # Lists are numbered in the browser
+            index = None
+            rows = self.data
+        columns = [[] for _ in self.table_keys]
+        for row in rows:
+            for column, cell in zip(columns, row_cells(row, self.table_keys)):
+                column.append(cell)
+        return {"index": index, "columns": columns}
+
+    def budget_cells(self, items, index):
+        # Cells of each row for the embedded JSON, as they are written. The
+        # keys of a dict table's rows are added to index.
+        for item in items:
+            if index is not None:
+                key, item = item
+                index.append(str(key))
+            yield row_cells(item, self.table_keys)
+
+
+class CognitionRecords(CognitionTable):
+    # Table of NDJSON records, streamed from a RecordFile. The keys and
+    # statistics come from the RecordFile's first pass, and the rows are
+    # read again from the file as the table is rendered.
+    __slots__ = ()
+
+    def interpret(self):
+        records = self.data
+        self.dict_count = records.dict_count
+        self.key_counts = records.key_counts
+        self.dict_ratio = self.dict_count / len(records) if len(records) else 0
+        self.table_keys = [
+            k for k, count in self.key_counts.items()
+            if count / len(records) >= DICTLIST_DICT_KEY_MIN_RATIO
+        ]
+        if not self.table_keys:
+            # Nothing much in common, show every key
+            self.table_keys = list(self.key_counts) or ["entry"]
+        self.contents = {
+            "data": records,
+            "dict_ratio": self.dict_ratio,
+            "table_keys": self.table_keys,
+            "key_counts": self.key_counts,
+            "ratio": DICTLIST_DICT_MIN_RATIO,
+            "omitted_keys": {
+                k: count for k, count in self.key_counts.items()
+                if k not in self.table_keys
+            },
+            "column_stats": records.column_stats(self.table_keys),
+        }
+        shown = len(records)
+        budget = self.context.budget
+        if budget is not None:
+            # Only the first rows are streamed, while they fit
+            shown = budget.rows(len(records))
+            self.contents["rows"] = self.contents["budget_rows"] = BudgetRows(
+                records.cells(self.table_keys), shown, budget, more=len(records) - shown)
+            return
+        virtual_table_rows = self.context.virtual_table_rows
+        if virtual_table_rows is not None and shown > virtual_table_rows:
+            if self.context.lazy is not None:
+                # Served report, the server sends one page at a time
+                self.contents["rows_url"] = self.context.lazy.rows_url(self)
+            else:
+                # Rows are written to the embedded JSON one at a time
+                self.contents["rows"] = records.cells(self.table_keys)
+
+
 class CognitionDict(Cognition):
     # Generic dictionary object, holds embedded kvs
-    def __init__(self, data, key, template=template_simple_kv):
-        super(CognitionDict, self).__init__(data, key, template)
+    __slots__ = ()
+
+    def __init__(self, data, key, template=template_simple_kv, context=None):
+        super(CognitionDict, self).__init__(data, key, template, context)
     # contents will probably need to be overloaded for this one...
 
     def interpret(self):
@@ -312,21 +737,28 @@ class CognitionDict(Cognition):
             raise Exception("CognitionDict data must be a dict")
         else:
             # This is a complex type, child entries should be interpreted also.
+            children = interpret_children(
+                ((KeyPath(self.key, k), v) for k, v in self.data.items()),
+                self.context
+            )
+            data = dict(zip(self.data.keys(), children))
+            if len(children) < len(self.data):
+                # Out of budget
+                data['...'] = Omitted(None, self.key, 'node budget', more=len(self.data) - len(children))
+            budget = self.context.budget
+            if budget is not None and budget.max_output_bytes is not None:
+                data = BudgetChildren(data, self.key, budget)
             self.contents = {
-                "data": {
-                    k: interpret_data(
-                        data=v,
-                        key="{}.{}".format(self.key, k)
-                    )
-                    for k, v in self.data.items()
-                },
+                "data": data,
                 "key_counts": len(self.data.keys()),
             }
 
 class CognitionDictFlat(CognitionList):
     # Simple (flat) dictionary - this can probably be displayed as a table
-    def __init__(self, data, key, template=template_simple_kv):
-        super(CognitionDictFlat, self).__init__(data, key, template)
+    __slots__ = ()
+
+    def __init__(self, data, key, template=template_simple_kv, context=None):
+        super(CognitionDictFlat, self).__init__(data, key, template, context)
     # contents will probably need to be overloaded for this one...
 
     def interpret(self):
@@ -341,3 +773,9 @@ class CognitionDictFlat(CognitionList):
                 "data": self.data,
                 "key_counts": len(self.data.keys()),
             }
+            budget = self.context.budget
+            if budget is not None:
+                # Each entry costs a node, like table rows
+                shown = budget.rows(len(self.data))
+                self.contents["shown"] = self.contents["budget_rows"] = BudgetRows(
+                    self.data.items(), shown, budget, more=len(self.data) - shown)
@@ -0,0 +1,166 @@
+# Column statistics for tables - what types are in each column, how many
+# rows are missing it, how many distinct values, and the spread of numbers.
+# The rows are turned into one list per column once, then every statistic
+# is a batch operation over a column.
+import math
+from collections import Counter
+
+HISTOGRAM_BINS = 8
+# Block characters U+2581 - U+2588, as entities so the page encoding doesn't matter
+HISTOGRAM_BARS = ['&#{};'.format(c) for c in range(0x2581, 0x2589)]
+NUMERIC_TYPES = (int, float)
+NUMPY_MIN_VALUES = 10000 # Numeric columns with at least this many numbers use numpy, if it's installed
+
+# Marks a cell where the row doesn't have the column's key
+MISSING = object()
+
+# Optional, for the numeric statistics of large columns. False until
+# load_numpy() has tried to import it, None if it isn't installed.
+numpy = False
+
+
+def table_columns(rows, table_keys):
+    # One list of values per table key. Rows that aren't dicts have no cells.
+    columns = [[] for _ in table_keys]
+    for row in rows:
+        if isinstance(row, dict):
+            get = row.get
+            for column, table_key in zip(columns, table_keys):
+                column.append(get(table_key, MISSING))
+    return columns
+
+
+def row_cells(row, table_keys):
+    # Cell text of a row, as shown in tables built by the browser. Missing
+    # keys are None. A row that isn't a dict is shown in the first column.
+    if isinstance(row, dict):
+        return [str(row[k]) if k in row else None for k in table_keys]
+    return [str(row)] + [None] * (len(table_keys) - 1)
+
+
+def finite(n):
+    # Whether n can take part in the numeric statistics. NaN and infinities
+    # (YAML .nan / .inf, or NaN in JSON) can't, nor can ints too big for a float.
+    try:
+        return math.isfinite(n)
+    except OverflowError:
+        return False
+
+
+def load_numpy():
+    # numpy, or None if it isn't installed. It is slow to import, so it's
+    # only imported once a column is big enough to need it.
+    global numpy
+    if numpy is False:
+        try:
+            import numpy as numpy_module
+        except ImportError:
+            numpy_module = None
+        numpy = numpy_module
+    return numpy
+
+
+def histogram(numbers, low, high, numpy=None):
+    # Counts of the numbers in HISTOGRAM_BINS equal width bins
+    if numpy is not None:
+        counts, _ = numpy.histogram(numbers, bins=HISTOGRAM_BINS, range=(low, high))
+        return counts.tolist()
+    counts = [0] * HISTOGRAM_BINS
+    width = (high - low) / HISTOGRAM_BINS
+    for n in numbers:
+        counts[min(int((n - low) / width), HISTOGRAM_BINS - 1)] += 1
+    return counts
+
+
+def sparkline(counts):
+    # Histogram as a line of block characters
+    top = max(counts)
+    if not top:
+        return ''
+    scale = len(HISTOGRAM_BARS) - 1
+    return ''.join(
+        HISTOGRAM_BARS[count * scale // top] if count else '&nbsp;' for count in counts)
+
+
+def column_stats(column):
+    missing = column.count(MISSING)
+    nulls = column.count(None)
+    # bool is an int, but it isn't a number for our purposes
+    types = Counter(map(type, column))
+    types.pop(type(MISSING), None)
+    stats = dict(
+        missing=missing,
+        nulls=nulls,
+        types={t.__name__: n for t, n in types.most_common()},
+    )
+    present = len(column) - missing
+    try:
+        stats['cardinality'] = len(set(column)) - (1 if missing else 0)
+    except TypeError:
+        # Lists and dicts in the column
+        stats['cardinality'] = len(set(map(repr, column))) - (1 if missing else 0)
+    stats['unique'] = present > 0 and stats['cardinality'] == present
+
+    numeric_count = sum(types[t] for t in NUMERIC_TYPES)
+    if numeric_count:
+        numbers = [v for v in column if type(v) in NUMERIC_TYPES and finite(v)]
+        numeric_count = len(numbers)
+    if numeric_count:
+        numpy = load_numpy() if numeric_count >= NUMPY_MIN_VALUES else None
+        if numpy is not None:
+            array = numpy.fromiter(numbers, dtype=float, count=numeric_count)
+            low, high, mean = array.min().item(), array.max().item(), array.mean().item()
+        else:
+            array = numbers
+            # Summed as floats, a sum of big ints can be too big to divide
+            low, high, mean = min(numbers), max(numbers), sum(map(float, numbers)) / numeric_count
+        stats.update(min=low, max=high, mean=mean)
+        # The range can still be too wide for a float, e.g. -1e308 to 1e308
+        if high > low and finite(high - low):
+            stats['histogram'] = histogram(array, low, high, numpy)
+            stats['sparkline'] = sparkline(stats['histogram'])
+    return stats
+
+
+def table_stats(rows, table_keys):
+    # Statistics for each table key, in the same order
+    return [column_stats(column) for column in table_columns(rows, table_keys)]
+
+
+class ColumnAccumulator:
+    # The statistics of column_stats that can be kept up to date one value at
+    # a time, for rows that are streamed rather than held in memory.
+    # Cardinality and histograms need every value, so they are left out.
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.types = Counter()
+        self.numeric_count = 0
+        self.total = 0
+        self.low = None
+        self.high = None
+
+    def add(self, value):
+        self.count += 1
+        value_type = type(value)
+        self.types[value_type] += 1
+        if value is None:
+            self.nulls += 1
+        elif value_type in NUMERIC_TYPES and finite(value):
+            self.numeric_count += 1
+            self.total += float(value)
+            if self.low is None or value < self.low:
+                self.low = value
+            if self.high is None or value > self.high:
+                self.high = value
+
+    def stats(self, rows):
+        # rows is the number of rows in the table, for the missing count
+        stats = dict(
+            missing=rows - self.count,
+            nulls=self.nulls,
+            types={t.__name__: n for t, n in self.types.most_common()},
+        )
+        if self.numeric_count:
+            stats.update(min=self.low, max=self.high, mean=self.total / self.numeric_count)
+        return stats
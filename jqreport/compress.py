@@ -0,0 +1,22 @@
+# Gzipped, base64 encoded html - used for shards, and for the body of
+# compressed reports. The browser unpacks it with DecompressionStream.
+import base64
+import zlib
+
+COMPRESSION_LEVEL = 6
+
+
+def compress_chunks(chunks):
+    # Compress and encode the chunks as they come, yielding base64 text.
+    # The html is never held in memory as a whole.
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = b''
+    for chunk in chunks:
+        pending += compressor.compress(chunk.encode('utf-8'))
+        # base64 works on 3 byte groups, keep the remainder for later
+        split = len(pending) - len(pending) % 3
+        if split:
+            yield base64.b64encode(pending[:split]).decode('ascii')
+            pending = pending[split:]
+    pending += compressor.flush()
+    yield base64.b64encode(pending).decode('ascii')
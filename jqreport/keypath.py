@@ -0,0 +1,47 @@
+# Key paths of nodes in the report, e.g. ..Reservations[3].Instances. Every
+# node has one, but few are ever shown, so a path is kept as its parent's
+# path and the last step, and only formatted into a string when needed.
+
+
+class KeyPath:
+    # Path of a dict entry, parent.step
+    __slots__ = ('parent', 'step')
+
+    def __init__(self, parent, step):
+        # parent is a KeyPath, or a string for the top of the tree
+        self.parent = parent
+        self.step = step
+
+    def __str__(self):
+        # Iterative, so deep documents don't hit the recursion limit
+        steps = []
+        path = self
+        while isinstance(path, KeyPath):
+            steps.append(path)
+            path = path.parent
+        text = path
+        for path in reversed(steps):
+            text = path.join(text)
+        return text
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, str(self))
+
+    def join(self, parent_text):
+        return '{}.{}'.format(parent_text, self.step)
+
+
+class IndexPath(KeyPath):
+    # Path of a list entry, parent[step]
+    __slots__ = ()
+
+    def join(self, parent_text):
+        return '{}[{}]'.format(parent_text, self.step)
+
+
+class OnlyKeyPath(KeyPath):
+    # Path of the only entry of a dict, which is shown in place of the dict
+    __slots__ = ()
+
+    def join(self, parent_text):
+        return '{}.{}'.format(parent_text.rstrip('.'), self.step)
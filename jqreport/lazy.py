@@ -0,0 +1,136 @@
+# Lazy sections, for reports served by `jqreport serve`. Nested lists and
+# dicts are not interpreted or rendered until the browser asks for them;
+# the page gets a placeholder which fetches the section from the server.
+import itertools
+
+from .columns import row_cells, finite, NUMERIC_TYPES
+
+PLACEHOLDER = (
+    '<div class="jqreport-lazy" id="lazy_{section_id}" data-url="{url}">'
+    '<button class="btn btn-secondary" type="button" '
+    'onclick="jqreport_load_fragment(this.parentNode)">'
+    '<span class="fa fa-plus"></span> {label}</button></div>'
+)
+
+
+class LazySection:
+    # A subtree waiting to be rendered. The templates embed it like a Cognition.
+    def __init__(self, section_id, data, key, allow_table):
+        self.section_id = section_id
+        self.data = data
+        self.key = key
+        self.allow_table = allow_table
+
+    def __str__(self):
+        return PLACEHOLDER.format(
+            section_id=self.section_id,
+            url='/fragment?id={}'.format(self.section_id),
+            label="{} ({} items)".format(self.key, len(self.data)))
+
+
+class LazySections:
+    # Registry of everything the page can ask the server for, by number.
+    # Each part of the document is registered once, so reloading the page
+    # or opening a section again reuses its number rather than adding more.
+    def __init__(self):
+        self.sections = dict()
+        self.ids = dict()
+
+    def register(self, item, data, key):
+        # Number of the item for this data and key, the first one registered is kept
+        ident = (type(item).__name__, id(data), str(key))
+        section_id = self.ids.get(ident)
+        if section_id is None:
+            section_id = len(self.sections) + 1
+            self.ids[ident] = section_id
+            self.sections[section_id] = item
+        return section_id
+
+    def get(self, section_id):
+        return self.sections.get(section_id)
+
+    def wants(self, data, key):
+        # The whole document is always rendered, single values are cheap
+        return key != '.' and isinstance(data, (dict, list)) and len(data) > 1
+
+    def defer(self, data, key, allow_table):
+        section = LazySection(len(self.sections) + 1, data, key, allow_table)
+        return self.get(self.register(section, data, key))
+
+    def embed_source(self, raw):
+        # Source panel of the page, fetched when opened
+        section_id = self.register(raw, raw.data, None)
+        return PLACEHOLDER.format(
+            section_id=section_id, url='/source?id={}'.format(section_id),
+            label='Source')
+
+    def rows_url(self, table):
+        # Large tables are paged by the server, see table_rows
+        return '/rows?id={}'.format(self.register(table, table.data, table.key))
+
+
+def table_rows(table, offset=0, limit=None, search=None, sort=None, order='asc'):
+    # One page of a CognitionTable for bootstrap-table's server side
+    # pagination, as {"total": n, "rows": [{"index": ..., "c0": ...}]}
+    if isinstance(table.data, dict):
+        rows = ((str(k), row) for k, row in table.data.items())
+    else:
+        rows = ((idx + 1, row) for idx, row in enumerate(table.data))
+    end = None if limit is None else offset + limit
+    if not search and not sort:
+        # Just a page, only its rows are built
+        page = itertools.islice(rows, offset, end)
+        return dict(total=len(table.data), rows=[
+            table_row(index, row, table.table_keys) for index, row in page])
+
+    # Built rows, with the rows of data they came from for sorting
+    rows = ((table_row(index, row, table.table_keys), index, row) for index, row in rows)
+    if search:
+        search = search.lower()
+        rows = (
+            built for built in rows
+            if any(search in str(cell).lower() for cell in built[0].values() if cell is not None)
+        )
+    if sort:
+        # On the values themselves rather than the cell text, so numbers
+        # sort as numbers. The index column is numbered for lists.
+        if sort == 'index':
+            value = lambda built: built[1]
+        else:
+            value = lambda built: cell_value(built[2], sort, table.table_keys)
+        keyed = [(value(built), built) for built in rows]
+        present = sorted(
+            ((v, built) for v, built in keyed if v is not None),
+            key=lambda item: sort_key(item[0]), reverse=order == 'desc')
+        # Missing cells last, whichever way it's sorted
+        rows = [built for _, built in present] + [built for v, built in keyed if v is None]
+    else:
+        rows = list(rows)
+    return dict(total=len(rows), rows=[built[0] for built in rows[offset:end]])
+
+
+def cell_value(row, field, table_keys):
+    # Value of a row in column field (c0, c1...), as row_cells places it.
+    # None if the row doesn't have it.
+    try:
+        column = int(field[1:])
+    except ValueError:
+        return None
+    if column >= len(table_keys):
+        return None
+    if isinstance(row, dict):
+        return row.get(table_keys[column])
+    return row if column == 0 else None
+
+
+def sort_key(value):
+    # Numbers first, in numeric order, then everything else as text
+    if type(value) in NUMERIC_TYPES and finite(value):
+        return (0, value, '')
+    return (1, 0, str(value))
+
+
+def table_row(index, row, table_keys):
+    cells = {'c{}'.format(j): cell for j, cell in enumerate(row_cells(row, table_keys))}
+    cells['index'] = index
+    return cells
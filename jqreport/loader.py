@@ -1,70 +1,89 @@
-import yaml
-
-class SafeUnknownConstructor(yaml.constructor.SafeConstructor):
-    def __init__(self):
-        yaml.constructor.SafeConstructor.__init__(self)
-
-    def construct_undefined(self, node):
-        data = getattr(self, 'construct_' + node.id)(node)
-        datatype = type(data)
-        wraptype = type('TagWrap_'+datatype.__name__, (datatype,), {})
-        wrapdata = wraptype(data)
-        wrapdata.tag = lambda: None
-        wrapdata.datatype = lambda: None
-        setattr(wrapdata, "wrapTag", node.tag)
-        setattr(wrapdata, "wrapType", datatype)
-        return {node.tag: wrapdata}
-
-
-class SafeUnknownLoader(SafeUnknownConstructor, yaml.loader.SafeLoader):
-
-    def __init__(self, stream):
-        SafeUnknownConstructor.__init__(self)
-        yaml.loader.SafeLoader.__init__(self, stream)
-
-
-class SafeUnknownRepresenter(yaml.representer.SafeRepresenter):
-    def represent_data(self, wrapdata):
-        tag = False
-        if type(wrapdata).__name__.startswith('TagWrap_'):
-            datatype = getattr(wrapdata, "wrapType")
-            tag = getattr(wrapdata, "wrapTag")
-            data = datatype(wrapdata)
-        else:
-            data = wrapdata
-        node = super(SafeUnknownRepresenter, self).represent_data(data)
-        if tag:
-            node.tag = tag
-        return node
-
-class SafeUnknownDumper(SafeUnknownRepresenter, yaml.dumper.SafeDumper):
-
-    def __init__(self, stream,
-            default_style=None, default_flow_style=False,
-            canonical=None, indent=None, width=None,
-            allow_unicode=None, line_break=None,
-            encoding=None, explicit_start=None, explicit_end=None,
-            version=None, tags=None, sort_keys=True):
-
-        SafeUnknownRepresenter.__init__(self, default_style=default_style,
-                default_flow_style=default_flow_style, sort_keys=sort_keys)
-
-        yaml.dumper.SafeDumper.__init__(self,  stream,
-                                        default_style=default_style,
-                                        default_flow_style=default_flow_style,
-                                        canonical=canonical,
-                                        indent=indent,
-                                        width=width,
-                                        allow_unicode=allow_unicode,
-                                        line_break=line_break,
-                                        encoding=encoding,
-                                        explicit_start=explicit_start,
-                                        explicit_end=explicit_end,
-                                        version=version,
-                                        tags=tags,
-                                        sort_keys=sort_keys)
-
-def load_handle(f):
-    MySafeLoader = SafeUnknownLoader
-    yaml.constructor.SafeConstructor.add_constructor(None, SafeUnknownConstructor.construct_undefined)
-    return yaml.load(f, MySafeLoader)
+import json
+import mmap
+
+try:
+    # Optional faster JSON parser, falls back to the stdlib
+    import orjson
+except ImportError:
+    orjson = None
+
+INPUT_FORMATS = ['auto', 'json', 'yaml']
+
+
+def looks_like_json(text):
+    # JSON documents are always an object or array at the top level (for our
+    # purposes anyway). YAML flow style can look the same, so this is only a
+    # hint - the caller falls back to YAML if the JSON parse fails.
+    text = text.lstrip()
+    if isinstance(text, str):
+        text = text.lstrip('\ufeff')
+        return text[:1] in ('{', '[')
+    return text[:1] in (b'{', b'[')
+
+
+def load_json(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def load_yaml(text):
+    # PyYAML is slow to import, so it's only imported for YAML input
+    from .yamlloader import load_yaml
+    return load_yaml(text)
+
+
+def load_yaml_fallback(text, json_error):
+    # YAML parse of a document that looked like JSON but wasn't. If it isn't
+    # YAML either, it is most likely broken JSON, so the JSON error is raised.
+    try:
+        return load_yaml(text)
+    except Exception:
+        raise json_error
+
+
+def load_text(text, input_format='auto'):
+    # Parse a str / bytes document in the requested format
+    if input_format == 'json':
+        return load_json(text)
+    elif input_format == 'yaml':
+        return load_yaml(text)
+    if looks_like_json(text[:4096]):
+        try:
+            return load_json(text)
+        except ValueError as e:
+            # Probably YAML flow style, let the YAML parser have a go
+            json_error = e
+        return load_yaml_fallback(text, json_error)
+    return load_yaml(text)
+
+
+def load_handle(f, input_format='auto'):
+    return load_text(f.read(), input_format=input_format)
+
+
+def load_file(path, input_format='auto'):
+    # Map the file rather than reading it into a python string, the JSON
+    # parsers can work straight from the buffer.
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and pipes / special files can't be mapped
+            return load_text(f.read(), input_format=input_format)
+        with mm:
+            if orjson is None:
+                return load_text(mm[:], input_format=input_format)
+            if input_format == 'yaml' or (
+                    input_format == 'auto' and not looks_like_json(mm[:4096])):
+                return load_yaml(mm[:])
+            buf = memoryview(mm)
+            try:
+                return orjson.loads(buf)
+            except ValueError as e:
+                if input_format == 'json':
+                    raise
+                json_error = e
+            finally:
+                buf.release()
+            return load_yaml_fallback(mm[:], json_error)
@@ -5,16 +5,25 @@ import os
 # from yaml.constructor import ConstructorError
 import json
 import sys
-from .cognition import Cognition
-import subprocess
-import platform
+from .cognition import Cognition, Context, VIRTUAL_TABLE_MIN_ROWS
 import logging
+import time
 
-from .loader import load_handle
+from .loader import load_handle, load_file, INPUT_FORMATS
+from .cache import FRAGMENT_CACHE_SIZE
+from .ndjson import load_records
+from .shard import ShardWriter
+from .batch import batch, BATCH_OUTPUT_PATTERN, BATCH_STATE_FILE
+from .budget import Budget
+from .profile import Profile, no_stage
+from .sample import make_sampler, SAMPLERS, DEFAULT_SAMPLER, DEFAULT_SEED, \
+    COMPLEXITY_SAMPLE_SIZE, COMPLEX_LENGTH_THRESHOLD
 
 # import dateutil.parser
 
 DEFAULT_OUTPUT_FILE = "jqreport_{}.html".format(datetime.datetime.utcnow().isoformat())
+SHARDED_INDEX_FILE = "index.html"
+WATCH_INTERVAL = 1 # Seconds between checks of the input file in --watch mode
 
 # # Constructor for custom tags
 # def custom_tag(loader, suffix, node):
@@ -32,17 +41,212 @@ DEFAULT_OUTPUT_FILE = "jqreport_{}.html".format(datetime.datetime.utcnow().isofo
 
 
 
+def open_output(path):
+    import platform
+    import subprocess
+    if platform.system() == 'Darwin':       # macOS
+        subprocess.call(('open', path))
+    elif platform.system() == 'Windows':    # Windows
+        os.startfile(path)
+    else:                                   # linux variants
+        subprocess.call(('xdg-open', path))
+
+
+def output_paths(out_file):
+    # The html file to write and the shard directory, if the report is sharded
+    if out_file.endswith(('/', os.sep)) or os.path.isdir(out_file):
+        # Sharded report - an index page, large sections load on demand
+        return os.path.join(out_file, SHARDED_INDEX_FILE), out_file
+    return out_file, None
+
+
+def report(args):
+    # Build one report from the input
+    profile = Profile() if args.profile else None
+    stage = profile.stage if profile is not None else no_stage
+
+    with stage('load'):
+        if args.ndjson:
+            # Only counts the records, they are read again when rendering
+            if args.in_file:
+                source_data = load_records(path=args.in_file)
+            else:
+                source_data = load_records(handle=sys.stdin.buffer)
+        elif args.in_file:
+            source_data = load_file(args.in_file, input_format=args.input_format)
+        else:
+            # source_data = yaml.safe_load(sys.stdin)
+            source_data = load_handle(sys.stdin, input_format=args.input_format)
+
+    # With source views, the document is serialized once and nested nodes
+    # show a slice of it
+    sampler = make_sampler(args.sampler, size=args.sample_size,
+        threshold=args.sample_threshold, seed=args.seed)
+    budget = None
+    if args.max_output_bytes is not None or args.max_nodes is not None or args.max_depth is not None:
+        budget = Budget(max_output_bytes=args.max_output_bytes, max_nodes=args.max_nodes,
+            max_depth=args.max_depth)
+    shards = ShardWriter(args.shard_dir, budget=budget) if args.shard_dir else None
+    context = Context(source_data, source_views=args.source_views,
+        virtual_table_rows=args.virtual_table_rows, shards=shards, profile=profile,
+        sampler=sampler, fragment_cache_size=args.fragment_cache_mb * 1024 * 1024,
+        cache_dir=args.cache_dir, budget=budget, compress=args.compress)
+    complete = False
+    try:
+        with stage('interpret'):
+            if args.jobs > 1 and shards is None and budget is None:
+                # Sibling subtrees are rendered in worker processes (which are
+                # not profiled)
+                import multiprocessing
+                with multiprocessing.Pool(args.jobs) as pool:
+                    context.pool = pool
+                    cog = Cognition(source_data, context=context)
+                context.pool = None
+            else:
+                if args.jobs > 1:
+                    logging.warning("--jobs is not supported for sharded reports or with budgets, "
+                                    "rendering in one process.")
+                cog = Cognition(source_data, context=context)
+
+        # Chunks are written out as they are rendered, the report is never
+        # held in memory as a whole
+        with stage('render'):
+            if args.out_file == '-':
+                cog.stream(sys.stdout)
+                sys.stdout.flush()
+            else:
+                with open(args.out_file, 'w') as f:
+                    cog.stream(f)
+        complete = True
+    finally:
+        # Fragments finished before a failure are still saved, but the
+        # ones the run didn't get to aren't pruned
+        context.close(complete)
+
+    if profile is not None:
+        if args.profile == '-':
+            profile.write(sys.stderr)
+        else:
+            with open(args.profile, 'w') as f:
+                profile.write(f)
+
+
+def watch(args):
+    # Build the report again whenever the input file changes. Fragments are
+    # cached on disk, so only the parts of the input that changed are redone.
+    cache_dir = None
+    if args.cache_dir is None:
+        import tempfile
+        cache_dir = tempfile.TemporaryDirectory()
+        args.cache_dir = cache_dir.name
+    last_modified = None
+    opened = False
+    try:
+        while True:
+            try:
+                modified = os.stat(args.in_file).st_mtime_ns
+            except FileNotFoundError:
+                # Probably being replaced, try again next time
+                modified = last_modified
+            if modified != last_modified:
+                last_modified = modified
+                start = time.perf_counter()
+                try:
+                    report(args)
+                except Exception as e:
+                    # e.g. the file is only half written, keep watching
+                    logging.error("Couldn't build report from {}: {}".format(args.in_file, e))
+                else:
+                    sys.stderr.write("Wrote {} in {:.2f}s\n".format(
+                        args.out_file, time.perf_counter() - start))
+                    if args.open_output and not opened:
+                        open_output(args.out_file)
+                        opened = True
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache_dir is not None:
+            cache_dir.cleanup()
+
+
 def main():
     # CLI entrypoint
+    if sys.argv[1:2] == ['serve']:
+        # jqreport serve ... - imported here, the server isn't needed otherwise
+        from .serve import main as serve_main
+        return serve_main(sys.argv[2:])
     parser = argparse.ArgumentParser(
         description='Build an HTML report from JSON or YAML data in seconds.')
     parser.add_argument('-f', '--input-file', dest='in_file',
         help='Input JSON or YAML file (you can also pipe data in).')
+    parser.add_argument('--input-format', dest='input_format',
+        default='auto', choices=INPUT_FORMATS,
+        help='Format of the input data. Default: auto (sniff the input)')
+    parser.add_argument('--ndjson', dest='ndjson', action='store_true',
+        help='The input is JSON Lines / NDJSON, one record per line. The records '
+             'are streamed into a table without loading them all into memory.')
     parser.add_argument('-o', '--output-file', dest='out_file',
-        default=DEFAULT_OUTPUT_FILE,
-        help='Output HTML file. Default: {}'.format(DEFAULT_OUTPUT_FILE))
+        help='Output HTML file, or - for stdout. If this is a directory (e.g. report_dir/), '
+             'large sections are written to separate files next to an {} page. With --batch, '
+             'a pattern using {{dir}}, {{name}} and {{stem}} of each input. '
+             'Default: {} ({} with --batch)'.format(
+                 SHARDED_INDEX_FILE, DEFAULT_OUTPUT_FILE, BATCH_OUTPUT_PATTERN))
     parser.add_argument('--open-output', dest='open_output', action='store_true',
         help='Open the output file once it has been written to.')
+    parser.add_argument('--source-views', dest='source_views', action='store_true',
+        help='Show the source of nested objects, not just the whole document.')
+    parser.add_argument('--virtual-table-rows', dest='virtual_table_rows',
+        type=int, default=VIRTUAL_TABLE_MIN_ROWS,
+        help='Tables with more rows than this are built by the browser one page '
+             'at a time, instead of as html. Default: {}'.format(VIRTUAL_TABLE_MIN_ROWS))
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+        help='Number of processes used to interpret and render the top level '
+             'sections of the document, or the input files with --batch. Default: 1')
+    parser.add_argument('--sampler', dest='sampler',
+        default=DEFAULT_SAMPLER, choices=sorted(SAMPLERS),
+        help='How children of large lists and dicts are sampled to work out '
+             'their layout. Default: {}'.format(DEFAULT_SAMPLER))
+    parser.add_argument('--sample-size', dest='sample_size', type=int,
+        default=COMPLEXITY_SAMPLE_SIZE,
+        help='Number of children sampled. Default: {}'.format(COMPLEXITY_SAMPLE_SIZE))
+    parser.add_argument('--sample-threshold', dest='sample_threshold', type=int,
+        default=COMPLEX_LENGTH_THRESHOLD,
+        help='Lists and dicts with more children than this are sampled. '
+             'Default: {}'.format(COMPLEX_LENGTH_THRESHOLD))
+    parser.add_argument('--seed', dest='seed', type=int, default=DEFAULT_SEED,
+        help='Seed for the random samplers. Default: {}'.format(DEFAULT_SEED))
+    parser.add_argument('--fragment-cache-mb', dest='fragment_cache_mb', type=int,
+        default=FRAGMENT_CACHE_SIZE // (1024 * 1024),
+        help='Megabytes of html kept for repeated subtrees, which are only rendered '
+             'once. 0 turns the cache off. Default: {}'.format(FRAGMENT_CACHE_SIZE // (1024 * 1024)))
+    parser.add_argument('--max-output-bytes', dest='max_output_bytes', type=int,
+        help='Stop rendering sections once the report is about this big. '
+             'The first section left out says so.')
+    parser.add_argument('--max-nodes', dest='max_nodes', type=int,
+        help='Interpret at most this many parts of the document (table rows and '
+             'key / values count too). The rest are summarised as "N more items".')
+    parser.add_argument('--max-depth', dest='max_depth', type=int,
+        help='Lists and dicts nested deeper than this are shown as collapsed JSON. '
+             'The children of the top of the document are at depth 1.')
+    parser.add_argument('--compress', dest='compress', action='store_true',
+        help='Gzip the body of the report into the page, it is unpacked by the browser '
+             'when opened. Much smaller files, but the report needs javascript.')
+    parser.add_argument('--cache-dir', dest='cache_dir',
+        help='Keep rendered parts of the report in this directory, so that the '
+             'next report of a similar input only renders what has changed.')
+    parser.add_argument('--watch', dest='watch', action='store_true',
+        help='Keep running, and build the report again whenever the input file changes.')
+    parser.add_argument('--batch', dest='batch', nargs='+', metavar='INPUT',
+        help='Build a report for each of these input files or glob patterns. '
+             'Inputs that haven\'t changed since the last batch are skipped.')
+    parser.add_argument('--batch-state', dest='batch_state', default=BATCH_STATE_FILE,
+        help='File recording the inputs of the last batch. Default: {}'.format(BATCH_STATE_FILE))
+    parser.add_argument('--force', dest='force', action='store_true',
+        help='With --batch, rebuild every report even if its input hasn\'t changed.')
+    parser.add_argument('--profile', dest='profile', nargs='?', const='-',
+        help='Write timings, memory use, node counts and the slowest keys as JSON '
+             'to this file, or to stderr if no file is given.')
     parser.add_argument('--debug', dest='debug', action='store_true',
         help='Show debugging output.')
 
@@ -52,31 +256,32 @@ def main():
 
     args = parser.parse_args()
     if args.debug:
-        logging.basicConfig(stream=sys.stdout, level=logging.DEBUG,
+        # Keep the log out of the report if the report is going to stdout
+        log_stream = sys.stderr if args.out_file == '-' else sys.stdout
+        logging.basicConfig(stream=log_stream, level=logging.DEBUG,
             format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
         )
         cog_logger = logging.getLogger('jqreport.cognition')
         cog_logger.setLevel(logging.DEBUG)
 
-    if args.in_file:
-        with open(args.in_file, 'r') as f:
-            # source_data = yaml.safe_load(f)
-            source_data = load_handle(f)
+    if args.batch:
+        if args.in_file or args.watch or args.out_file == '-':
+            parser.error('--batch can\'t be used with -f, --watch or -o -')
+        if not batch(args, output_paths):
+            sys.exit(1)
+        return
+
+    args.out_file, args.shard_dir = output_paths(args.out_file or DEFAULT_OUTPUT_FILE)
+
+    if args.watch:
+        if not args.in_file:
+            parser.error('--watch needs an input file (-f)')
+        watch(args)
     else:
-        # source_data = yaml.safe_load(sys.stdin)
-        source_data = load_handle(sys.stdin)
-    cog = Cognition(source_data)
-
-    with open(args.out_file, 'w') as f:
-        f.write(cog.render())
-
-    if args.open_output:
-        if platform.system() == 'Darwin':       # macOS
-            subprocess.call(('open', args.out_file))
-        elif platform.system() == 'Windows':    # Windows
-            os.startfile(args.out_file)
-        else:                                   # linux variants
-            subprocess.call(('xdg-open', args.out_file))
+        report(args)
+
+    if args.open_output and args.out_file != '-' and not args.watch:
+        open_output(args.out_file)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,92 @@
+# JSON Lines / NDJSON input - one JSON document per line, e.g. log and event
+# exports. The records are never all in memory. A first pass counts them and
+# works out the table columns, then the rows are read again as they are
+# rendered. Piped input is copied to a temporary file so it can be re-read.
+import tempfile
+
+from .columns import ColumnAccumulator, row_cells
+from .loader import load_json
+
+
+class RecordFile:
+    # The records of an NDJSON file. Iterating reads the file again each time.
+    def __init__(self, path=None, handle=None):
+        # handle is a binary file object to read once (e.g. stdin)
+        self.path = path
+        self.handle = handle
+        self.spill = None
+        self.count = 0
+        self.dict_count = 0
+        self.key_counts = dict()
+        self.accumulators = dict()
+
+    def __len__(self):
+        return self.count
+
+    def __str__(self):
+        return "{} records from {}".format(self.count, self.path or 'stdin')
+
+    def lines(self):
+        if self.spill is not None:
+            self.spill.seek(0)
+            return self.spill
+        return open(self.path, 'rb')
+
+    def read(self, lines):
+        for line in lines:
+            if line.strip():
+                yield load_json(line)
+
+    def __iter__(self):
+        lines = self.lines()
+        try:
+            yield from self.read(lines)
+        finally:
+            if lines is not self.spill:
+                lines.close()
+
+    def scan(self):
+        # First pass - count the records and their keys, and keep running
+        # statistics for every key
+        if self.handle is not None:
+            self.spill = tempfile.TemporaryFile()
+            lines = self.copy(self.handle, self.spill)
+        else:
+            lines = open(self.path, 'rb')
+        try:
+            for record in self.read(lines):
+                self.count += 1
+                if isinstance(record, dict):
+                    self.dict_count += 1
+                    for k, v in record.items():
+                        self.key_counts[k] = self.key_counts.get(k, 0) + 1
+                        accumulator = self.accumulators.get(k)
+                        if accumulator is None:
+                            accumulator = self.accumulators[k] = ColumnAccumulator()
+                        accumulator.add(v)
+        finally:
+            if lines is not self.spill and self.handle is None:
+                lines.close()
+        return self
+
+    def copy(self, handle, spill):
+        # Read lines from the handle, keeping a copy in the spill file
+        for line in handle:
+            spill.write(line)
+            yield line
+
+    def column_stats(self, table_keys):
+        return [
+            self.accumulators.get(k, ColumnAccumulator()).stats(self.count)
+            for k in table_keys
+        ]
+
+    def cells(self, table_keys):
+        # Rows as lists of cell text for the embedded JSON of large tables,
+        # like CognitionTable.columns() but one row at a time
+        for record in self:
+            yield row_cells(record, table_keys)
+
+
+def load_records(path=None, handle=None):
+    return RecordFile(path=path, handle=handle).scan()
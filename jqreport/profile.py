@@ -0,0 +1,154 @@
+# Profiling - where does the time go when a report is slow? Records per stage
+# timings and allocations, node and template counts, and the slowest parts
+# of the document. Nothing here runs unless a Profile is given to the Context.
+import heapq
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from .cache import KEY_PLACEHOLDER
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS isn't reported there
+    resource = None
+
+SLOWEST_KEYS = 20 # Number of key paths listed in the slowest_keys section
+# What the time of each key is spent on: shape analysis (simplicity and
+# table detection), interpreting the node, and rendering its template
+KEY_PHASES = ['shape_s', 'interpret_s', 'render_s']
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes on macOS, kilobytes everywhere else
+        peak = peak // 1024
+    return peak
+
+
+@contextmanager
+def no_stage(name):
+    # Stand-in for Profile.stage when not profiling
+    yield
+
+
+class Profile:
+    # Collects the profile of one report. Use it from python like this:
+    #
+    #   profile = Profile()
+    #   with profile.stage('interpret'):
+    #       cog = Cognition(data, context=Context(data, profile=profile))
+    #   with profile.stage('render'):
+    #       cog.stream(f)
+    #   profile.write(sys.stderr)
+    def __init__(self, slowest_keys=SLOWEST_KEYS):
+        self.stages = dict()
+        self.nodes = dict()
+        self.templates = dict()
+        self.slowest_keys = slowest_keys
+        # Seconds spent on each key, by phase. Keyed on the key path objects,
+        # only the slowest few are ever formatted.
+        self.key_times = dict()
+        # Time spent in nested timed() blocks, for each one that is open
+        self.child_seconds = []
+        # Key paths of the cached fragments being interpreted, innermost
+        # last. Fragments are interpreted under a placeholder key.
+        self.fragment_keys = []
+
+    @contextmanager
+    def stage(self, name):
+        # Wall time and net allocated memory blocks of a stage of the report
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = dict(
+                wall_s=time.perf_counter() - start,
+                allocated_blocks=sys.getallocatedblocks() - blocks,
+                peak_rss_kb=peak_rss_kb())
+
+    @contextmanager
+    def fragment(self, key):
+        # Nodes created inside are in the fragment for key
+        self.fragment_keys.append(self.key_text(key))
+        try:
+            yield
+        finally:
+            self.fragment_keys.pop()
+
+    def key_text(self, key):
+        text = str(key)
+        if self.fragment_keys:
+            text = text.replace(KEY_PLACEHOLDER, self.fragment_keys[-1])
+        return text
+
+    @contextmanager
+    def timed(self, key, phase):
+        # Self time of key in phase. Time spent in timed() blocks nested
+        # inside (the node's children) is theirs, not this key's.
+        self.child_seconds.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            child_seconds = self.child_seconds.pop()
+            if self.child_seconds:
+                self.child_seconds[-1] += seconds
+            if self.fragment_keys:
+                # Placeholder keys only mean something while in the fragment
+                key = self.key_text(key)
+            times = self.key_times.get(key)
+            if times is None:
+                times = self.key_times[key] = dict.fromkeys(KEY_PHASES, 0.0)
+            times[phase] += seconds - child_seconds
+
+    def timed_chunks(self, key, chunks):
+        # Chunks of a node's html, with the time to render each one
+        # (less its children's) counted against key
+        chunks = iter(chunks)
+        while True:
+            with self.timed(key, 'render_s'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def node_created(self, node):
+        # Called once per Cognition that was interpreted
+        name = type(node).__name__
+        self.nodes[name] = self.nodes.get(name, 0) + 1
+
+    def template_rendered(self, template):
+        self.templates[template.name] = self.templates.get(template.name, 0) + 1
+
+    def report(self):
+        # Times are each key's own, without its children. Nodes sharing a key
+        # path (the page and the top of the document are both '.') are
+        # counted together.
+        key_times = dict()
+        for key, times in self.key_times.items():
+            total = key_times.setdefault(str(key), dict.fromkeys(KEY_PHASES, 0.0))
+            for phase, seconds in times.items():
+                total[phase] += seconds
+        slowest = heapq.nlargest(
+            self.slowest_keys, key_times.items(), key=lambda item: sum(item[1].values()))
+        return dict(
+            stages=self.stages,
+            nodes=self.nodes,
+            templates=self.templates,
+            slowest_keys=[
+                dict(key=key, total_s=sum(times.values()), **times)
+                for key, times in slowest
+            ],
+        )
+
+    def write(self, f):
+        json.dump(self.report(), f, indent=2)
+        f.write('\n')
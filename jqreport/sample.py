@@ -0,0 +1,101 @@
+# Sampling of large containers for type and complexity detection. Big lists
+# and dicts are judged on a sample of their children, so that detection
+# costs the same no matter how big they are. Every sampler is deterministic,
+# the same input always gives the same sample and so the same report.
+import itertools
+import random
+
+COMPLEXITY_SAMPLE_SIZE = 50   # Sample size for assessing complexity
+COMPLEX_LENGTH_THRESHOLD = 100 # Length threshold for an object to be considered complex
+DEFAULT_SEED = 0
+
+
+class Sampler:
+    # Base sampler - containers up to the threshold are used whole, larger
+    # ones are passed to choose(), a reservoir sample unless overridden.
+    def __init__(self, size=COMPLEXITY_SAMPLE_SIZE, threshold=COMPLEX_LENGTH_THRESHOLD,
+                 seed=DEFAULT_SEED):
+        self.size = size
+        self.threshold = threshold
+        self.seed = seed
+
+    def __repr__(self):
+        return '{}(size={}, threshold={}, seed={})'.format(
+            type(self).__name__, self.size, self.threshold, self.seed)
+
+    def sample(self, children):
+        # children is a list, a dict view or any other iterable
+        try:
+            length = len(children)
+        except TypeError:
+            # Plain iterator, length unknown until it has been read
+            return self.reservoir(children)
+        if length <= max(self.threshold, self.size):
+            return list(children)
+        return self.choose(children, length)
+
+    def choose(self, children, length):
+        return self.reservoir(children)
+
+    def rng(self):
+        # A new generator for every container, so the sample doesn't depend on
+        # the order the containers are visited in (e.g. with --jobs)
+        return random.Random(self.seed)
+
+    def reservoir(self, children):
+        # Algorithm R - a single pass over any iterable, holding at most size items
+        rng = self.rng()
+        sample = []
+        for idx, child in enumerate(children):
+            if idx < self.size:
+                sample.append(child)
+            else:
+                pick = rng.randrange(idx + 1)
+                if pick < self.size:
+                    sample[pick] = child
+        return sample
+
+
+class RandomSampler(Sampler):
+    # Random children, picked by index
+    def choose(self, children, length):
+        indexes = sorted(self.rng().sample(range(length), self.size))
+        if isinstance(children, (list, tuple)):
+            return [children[idx] for idx in indexes]
+        # Dict views can't be indexed, pick the children out in one pass
+        wanted = set(indexes)
+        return [child for idx, child in enumerate(children) if idx in wanted]
+
+
+class ReservoirSampler(Sampler):
+    # Random children, in one pass without indexing - works on anything
+    pass
+
+
+class StratifiedSampler(Sampler):
+    # The first, middle and last children, in equal parts. Catches data that
+    # changes shape part way through, e.g. appended records. No randomness.
+    def choose(self, children, length):
+        part = self.size // 3
+        head = self.size - 2 * part
+        middle = (length - part) // 2
+        if isinstance(children, (list, tuple)):
+            return (list(children[:head]) + list(children[middle:middle + part])
+                    + list(children[length - part:]))
+        return list(itertools.chain(
+            itertools.islice(children, head),
+            itertools.islice(children, middle, middle + part),
+            itertools.islice(children, length - part, length),
+        ))
+
+
+SAMPLERS = {
+    'random': RandomSampler,
+    'reservoir': ReservoirSampler,
+    'stratified': StratifiedSampler,
+}
+DEFAULT_SAMPLER = 'random'
+
+
+def make_sampler(name=DEFAULT_SAMPLER, **kwargs):
+    return SAMPLERS[name](**kwargs)
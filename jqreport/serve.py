@@ -0,0 +1,136 @@
+# jqreport serve - a local report server. The document is parsed and the
+# templates compiled once. The page is rendered with nested sections left
+# out, and each section is rendered when the browser opens it.
+import argparse
+import json
+import logging
+import sys
+import webbrowser
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from .cognition import Cognition, CognitionTable, Context, interpret_node, fragments, \
+    VIRTUAL_TABLE_MIN_ROWS
+from .lazy import LazySections, LazySection, table_rows
+from .loader import load_handle, load_file, INPUT_FORMATS
+from .ndjson import load_records
+from .source import LazySource
+
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8000
+SERVE_PAGE_SIZE = 50 # Rows per page of server side tables, if the browser doesn't say
+
+logger = logging.getLogger(__name__)
+
+
+class ReportServer(HTTPServer):
+    # One request at a time - the Context's caches are shared by every request
+    def __init__(self, address, data, context):
+        HTTPServer.__init__(self, address, ReportHandler)
+        self.data = data
+        self.context = context
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        context = self.server.context
+        try:
+            if url.path == '/':
+                self.send_chunks(Cognition(self.server.data, context=context).generate())
+                return
+            section = context.lazy.get(int(params.get('id', 0)))
+            if url.path == '/fragment' and isinstance(section, LazySection):
+                node = interpret_node(section.data, section.key, section.allow_table, context)
+                self.send_chunks(fragments(node))
+            elif url.path == '/source' and isinstance(section, LazySource):
+                self.send_chunks([
+                    '<p><pre class="prettyprint"><code class="language-json">', str(section),
+                    '</code></pre></p>'])
+            elif url.path == '/rows' and isinstance(section, CognitionTable):
+                page = table_rows(
+                    section,
+                    offset=int(params.get('offset', 0)),
+                    limit=int(params.get('limit', SERVE_PAGE_SIZE)),
+                    search=params.get('search'),
+                    sort=params.get('sort'),
+                    order=params.get('order', 'asc'))
+                self.send_chunks([json.dumps(page)], content_type='application/json')
+            else:
+                self.send_error(404)
+        except ValueError:
+            self.send_error(400)
+
+    def send_chunks(self, chunks, content_type='text/html'):
+        # The response is written as it is rendered, the connection is closed
+        # at the end so no length is needed
+        self.send_response(200)
+        self.send_header('Content-Type', '{}; charset=utf-8'.format(content_type))
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk.encode('utf-8'))
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def serve(data, host=SERVE_HOST, port=SERVE_PORT, source_views=False,
+          virtual_table_rows=VIRTUAL_TABLE_MIN_ROWS, open_browser=False):
+    context = Context(data, source_views=source_views, virtual_table_rows=virtual_table_rows,
+        lazy=LazySections(), fragment_cache_size=0)
+    server = ReportServer((host, port), data, context)
+    url = 'http://{}:{}/'.format(host, server.server_port)
+    sys.stderr.write("Serving report on {} (Ctrl-C to stop)\n".format(url))
+    if open_browser:
+        webbrowser.open(url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    # CLI entrypoint for `jqreport serve`
+    parser = argparse.ArgumentParser(prog='jqreport serve',
+        description='Serve an HTML report of JSON or YAML data on a local port. '
+                    'Nested sections are only rendered when you open them.')
+    parser.add_argument('-f', '--input-file', dest='in_file',
+        help='Input JSON or YAML file (you can also pipe data in).')
+    parser.add_argument('--input-format', dest='input_format',
+        default='auto', choices=INPUT_FORMATS,
+        help='Format of the input data. Default: auto (sniff the input)')
+    parser.add_argument('--ndjson', dest='ndjson', action='store_true',
+        help='The input is JSON Lines / NDJSON, one record per line.')
+    parser.add_argument('--host', dest='host', default=SERVE_HOST,
+        help='Address to listen on. Default: {}'.format(SERVE_HOST))
+    parser.add_argument('-p', '--port', dest='port', type=int, default=SERVE_PORT,
+        help='Port to listen on, 0 for any free port. Default: {}'.format(SERVE_PORT))
+    parser.add_argument('--source-views', dest='source_views', action='store_true',
+        help='Show the source of nested objects, not just the whole document.')
+    parser.add_argument('--virtual-table-rows', dest='virtual_table_rows',
+        type=int, default=VIRTUAL_TABLE_MIN_ROWS,
+        help='Tables with more rows than this are paged by the server. '
+             'Default: {}'.format(VIRTUAL_TABLE_MIN_ROWS))
+    parser.add_argument('--open-output', dest='open_output', action='store_true',
+        help='Open the report in a browser.')
+    parser.add_argument('--debug', dest='debug', action='store_true',
+        help='Show debugging output.')
+    args = parser.parse_args(argv)
+    logging.basicConfig(stream=sys.stderr, level=logging.DEBUG if args.debug else logging.WARNING,
+        format="%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s")
+
+    if args.ndjson:
+        if args.in_file:
+            data = load_records(path=args.in_file)
+        else:
+            data = load_records(handle=sys.stdin.buffer)
+    elif args.in_file:
+        data = load_file(args.in_file, input_format=args.input_format)
+    else:
+        data = load_handle(sys.stdin, input_format=args.input_format)
+    serve(data, host=args.host, port=args.port, source_views=args.source_views,
+          virtual_table_rows=args.virtual_table_rows, open_browser=args.open_output)
@@ -0,0 +1,100 @@
+# Shape analysis - how complex each container in the document is, what its
+# children look like etc. Each container is analysed once and the result is
+# cached against the object, so nested interpretation doesn't walk the same
+# subtree over and over.
+import logging
+import statistics
+
+from .sample import make_sampler
+
+logger = logging.getLogger(__name__)
+
+
+class Shape:
+    # Summary of a single container. There's one for every container that is
+    # interpreted, so no __dict__.
+    __slots__ = ('obj', 'size', 'simplicity', 'modal_type', '_key_counts', '_dict_count')
+
+    def __init__(self, obj, simplicity, modal_type=None):
+        self.obj = obj
+        self.size = len(obj)
+        # 0 == scalar, 1 == list / flat, 2 == table, 3+ == complex
+        self.simplicity = simplicity
+        # Most common type of the children (None if it couldn't be worked out)
+        self.modal_type = modal_type
+        self._key_counts = None
+        self._dict_count = None
+
+    def count_keys(self):
+        self._dict_count, self._key_counts = count_keys(
+            self.obj.values() if isinstance(self.obj, dict) else self.obj)
+
+    @property
+    def dict_count(self):
+        if self._dict_count is None:
+            self.count_keys()
+        return self._dict_count
+
+    @property
+    def key_counts(self):
+        if self._key_counts is None:
+            self.count_keys()
+        return self._key_counts
+
+
+def count_keys(children):
+    # How many children are dicts, and how many of those have each key
+    dict_count = 0
+    key_counts = dict()
+    for d in children:
+        if isinstance(d, dict):
+            dict_count = dict_count + 1
+            for k in d:
+                key_counts[k] = key_counts.get(k, 0) + 1
+    return dict_count, key_counts
+
+
+class ShapeIndex:
+    # Cache of Shapes for the containers in a document, by object identity.
+    # Holds a reference to the document so that the ids stay valid.
+    def __init__(self, data, sampler=None):
+        self.data = data
+        self.shapes = dict()
+        # Picks the children that large containers are judged on
+        self.sampler = sampler if sampler is not None else make_sampler()
+
+    def simplicity(self, obj):
+        # Rate the simplicity of the object. Lower number is more simple.
+        if not obj or not isinstance(obj, (dict, list)):
+            # Null, empty or scalar
+            return 0
+        if len(obj) == 1:
+            # Scalar dict / list, delegate to the only child
+            for child in (obj.values() if isinstance(obj, dict) else obj):
+                return self.simplicity(child)
+        return self.shape(obj).simplicity
+
+    def shape(self, obj):
+        shape = self.shapes.get(id(obj))
+        if shape is None:
+            shape = self.analyse(obj)
+            self.shapes[id(obj)] = shape
+        return shape
+
+    def analyse(self, obj):
+        if isinstance(obj, dict):
+            sample = self.sampler.sample(obj.values())
+            modal_type = None
+        else:
+            sample = self.sampler.sample(obj)
+            try:
+                modal_type = statistics.mode([el.__class__ for el in sample])
+            except statistics.StatisticsError:
+                # This can happen when types are mixed
+                modal_type = None
+        # Children are analysed (and cached) before their parent
+        max_rval = 0
+        for v in sample:
+            max_rval = max(max_rval, self.simplicity(v))
+        logger.debug("Object (n=%s) has simplicity %s", len(obj), max_rval + 1)
+        return Shape(obj, simplicity=max_rval + 1, modal_type=modal_type)
@@ -0,0 +1,56 @@
+# Sharded reports - large sections of the report are written to their own
+# files next to the index page, and only loaded when the reader opens them.
+# Shards are plain javascript so that they load with a <script> tag, even
+# when the report is opened from file:// with no server.
+import json
+import os
+
+from .budget import count_chunks
+from .compress import compress_chunks
+
+SHARD_MIN_ITEMS = 1000 # Sections with more items than this are written to a shard
+SHARD_DIRECTORY = 'shards'
+
+PLACEHOLDER = (
+    '<div class="jqreport-shard" id="{shard_id}" data-src="{src}">'
+    '<button class="btn btn-secondary" type="button" '
+    'onclick="jqreport_load_shard(this.parentNode)">'
+    '<span class="fa fa-plus"></span> {label}</button></div>'
+)
+
+
+class ShardWriter:
+    # Writes sections of a report to gzipped, base64 encoded javascript files.
+    # Each shard calls jqreport_shard(id, payload) in the page when loaded.
+    def __init__(self, report_directory, min_items=SHARD_MIN_ITEMS, budget=None):
+        self.directory = os.path.join(report_directory, SHARD_DIRECTORY)
+        self.min_items = min_items
+        # The html of shards counts towards the output budget, if there is one
+        self.budget = budget
+        self.count = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def embed(self, chunks, label):
+        # Write the chunks to a new shard, return the html to put in its place
+        self.count += 1
+        shard_id = 'shard_{}'.format(self.count)
+        file_name = '{}.js'.format(shard_id)
+        if self.budget is not None and self.budget.max_output_bytes is not None:
+            chunks = count_chunks(chunks, self.budget)
+        with open(os.path.join(self.directory, file_name), 'w') as f:
+            f.write('jqreport_shard({}, "'.format(json.dumps(shard_id)))
+            self.write_compressed(f, chunks)
+            f.write('");\n')
+        return PLACEHOLDER.format(
+            shard_id=shard_id, src='{}/{}'.format(SHARD_DIRECTORY, file_name),
+            label=label)
+
+    def embed_source(self, raw):
+        # Source panel of the page, so the index page stays small
+        return self.embed(
+            ['<p><pre class="prettyprint"><code class="language-json">', str(raw),
+             '</code></pre></p>'], 'Source')
+
+    def write_compressed(self, f, chunks):
+        for text in compress_chunks(chunks):
+            f.write(text)
@@ -0,0 +1,108 @@
+# Source views of the data - the JSON text shown in the "Source" panels.
+import json
+from json.encoder import encode_basestring_ascii
+
+INDENT = 2
+
+_encode_scalar = json.JSONEncoder(default=str).encode
+
+
+def dumps(data):
+    # Same output as the old json.dumps(data, indent=2) in Cognition.render
+    return json.dumps(data, indent=INDENT, default=str)
+
+
+def _encode_key(key):
+    # Same key coercion as the json module
+    if isinstance(key, str):
+        return encode_basestring_ascii(key)
+    elif key is True or key is False or key is None or isinstance(key, (int, float)):
+        return encode_basestring_ascii(_encode_scalar(key))
+    return encode_basestring_ascii(str(key))
+
+
+class SourceIndex:
+    # The whole document serialized once, with the position of every container
+    # recorded so that each node's source is just a slice of the text.
+    def __init__(self, data):
+        self.data = data
+        self.text = None
+        self.offsets = None
+
+    def build(self):
+        chunks = []
+        offsets = dict()
+        # Keep track of the length written without joining the chunks
+        position = [0]
+
+        def write(chunk):
+            chunks.append(chunk)
+            position[0] += len(chunk)
+
+        def encode(obj, depth):
+            if isinstance(obj, dict):
+                if not obj:
+                    write('{}')
+                    return
+                start = position[0]
+                newline = '\n' + ' ' * (INDENT * (depth + 1))
+                write('{')
+                first = True
+                for k, v in obj.items():
+                    write(newline if first else ',' + newline)
+                    first = False
+                    write(_encode_key(k))
+                    write(': ')
+                    encode(v, depth + 1)
+                write('\n' + ' ' * (INDENT * depth) + '}')
+                offsets.setdefault(id(obj), (start, position[0], depth))
+            elif isinstance(obj, list):
+                if not obj:
+                    write('[]')
+                    return
+                start = position[0]
+                newline = '\n' + ' ' * (INDENT * (depth + 1))
+                write('[')
+                first = True
+                for v in obj:
+                    write(newline if first else ',' + newline)
+                    first = False
+                    encode(v, depth + 1)
+                write('\n' + ' ' * (INDENT * depth) + ']')
+                offsets.setdefault(id(obj), (start, position[0], depth))
+            elif isinstance(obj, str):
+                write(encode_basestring_ascii(obj))
+            else:
+                write(_encode_scalar(obj))
+
+        encode(self.data, 0)
+        self.text = ''.join(chunks)
+        self.offsets = offsets
+
+    def source(self, data):
+        # Source text for a node of the document
+        if self.text is None:
+            self.build()
+        location = self.offsets.get(id(data))
+        if location is None:
+            # Scalars and empty containers are cheap, just dump them
+            return dumps(data)
+        start, end, depth = location
+        text = self.text[start:end]
+        if depth:
+            # Nested nodes are indented relative to the document root
+            text = text.replace('\n' + ' ' * (INDENT * depth), '\n')
+        return text
+
+
+class LazySource:
+    # Stand-in for the raw source passed to templates. Nothing is serialized
+    # unless the template actually prints it.
+    def __init__(self, data, index=None):
+        self.data = data
+        self.index = index
+
+    def __str__(self):
+        if self.index is not None:
+            return self.index.source(self.data)
+        return dumps(self.data)
@@ -0,0 +1,110 @@
+# YAML loading and dumping, keeping tags that PyYAML doesn't know about
+# (e.g. CloudFormation's !Ref). Kept apart from loader so that reports of
+# JSON input never import PyYAML.
+import yaml
+
+
+class TagWrap:
+    # Value of a tag PyYAML doesn't know, with the tag in wrapTag and the
+    # plain type in wrapType. The classes are defined here rather than made
+    # per value, so that the values can be pickled (e.g. for --jobs workers).
+    def tag(self):
+        return None
+
+    def datatype(self):
+        return None
+
+
+class TagWrap_str(TagWrap, str):
+    pass
+
+
+class TagWrap_list(TagWrap, list):
+    pass
+
+
+class TagWrap_dict(TagWrap, dict):
+    pass
+
+
+TAG_WRAP_TYPES = {str: TagWrap_str, list: TagWrap_list, dict: TagWrap_dict}
+
+
+class SafeUnknownConstructor(yaml.constructor.SafeConstructor):
+    def __init__(self):
+        yaml.constructor.SafeConstructor.__init__(self)
+
+    def construct_undefined(self, node):
+        data = getattr(self, 'construct_' + node.id)(node)
+        datatype = type(data)
+        wrapdata = TAG_WRAP_TYPES[datatype](data)
+        setattr(wrapdata, "wrapTag", node.tag)
+        setattr(wrapdata, "wrapType", datatype)
+        return {node.tag: wrapdata}
+
+
+SafeUnknownConstructor.add_constructor(None, SafeUnknownConstructor.construct_undefined)
+
+
+class SafeUnknownLoader(SafeUnknownConstructor, yaml.loader.SafeLoader):
+
+    def __init__(self, stream):
+        SafeUnknownConstructor.__init__(self)
+        yaml.loader.SafeLoader.__init__(self, stream)
+
+
+if yaml.__with_libyaml__:
+    class CSafeUnknownLoader(yaml.cyaml.CParser, SafeUnknownConstructor, yaml.resolver.Resolver):
+        # Same as SafeUnknownLoader, but the scanner / parser is libyaml
+        def __init__(self, stream):
+            yaml.cyaml.CParser.__init__(self, stream)
+            SafeUnknownConstructor.__init__(self)
+            yaml.resolver.Resolver.__init__(self)
+else:
+    CSafeUnknownLoader = SafeUnknownLoader
+
+
+class SafeUnknownRepresenter(yaml.representer.SafeRepresenter):
+    def represent_data(self, wrapdata):
+        tag = False
+        if type(wrapdata).__name__.startswith('TagWrap_'):
+            datatype = getattr(wrapdata, "wrapType")
+            tag = getattr(wrapdata, "wrapTag")
+            data = datatype(wrapdata)
+        else:
+            data = wrapdata
+        node = super(SafeUnknownRepresenter, self).represent_data(data)
+        if tag:
+            node.tag = tag
+        return node
+
+class SafeUnknownDumper(SafeUnknownRepresenter, yaml.dumper.SafeDumper):
+
+    def __init__(self, stream,
+            default_style=None, default_flow_style=False,
+            canonical=None, indent=None, width=None,
+            allow_unicode=None, line_break=None,
+            encoding=None, explicit_start=None, explicit_end=None,
+            version=None, tags=None, sort_keys=True):
+
+        SafeUnknownRepresenter.__init__(self, default_style=default_style,
+                default_flow_style=default_flow_style, sort_keys=sort_keys)
+
+        yaml.dumper.SafeDumper.__init__(self,  stream,
+                                        default_style=default_style,
+                                        default_flow_style=default_flow_style,
+                                        canonical=canonical,
+                                        indent=indent,
+                                        width=width,
+                                        allow_unicode=allow_unicode,
+                                        line_break=line_break,
+                                        encoding=encoding,
+                                        explicit_start=explicit_start,
+                                        explicit_end=explicit_end,
+                                        version=version,
+                                        tags=tags,
+                                        sort_keys=sort_keys)
+
+
+def load_yaml(text):
+    return yaml.load(text, CSafeUnknownLoader)
@@ -25,5 +25,8 @@ setuptools.setup(
     install_requires=[
         'jinja2',
         'pyyaml'
-    ]
+    ],
+    extras_require={
+        'fast': ['orjson', 'numpy'],
+    }
 )